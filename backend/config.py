@@ -22,6 +22,15 @@ STAGGER_INTERVAL_MINUTES = int(os.environ.get("STAGGER_INTERVAL", "2"))
 # Cooldown after completing a full round-robin cycle (hours)
 ROUND_COOLDOWN_HOURS = int(os.environ.get("ROUND_COOLDOWN_HOURS", "3"))
 
+# Refresh access tokens this many seconds before they expire
+TOKEN_REFRESH_SKEW_SECONDS = int(os.environ.get("TOKEN_REFRESH_SKEW_SECONDS", "60"))
+
+# Refresh logs older than this are deleted by the scheduler's daily purge job
+REFRESH_LOG_RETENTION_DAYS = 180
+
+# Optional Redis for the shared sync log (e.g. redis://localhost:6379/0); empty keeps it in memory
+REDIS_URL = os.environ.get("REDIS_URL", "")
+
 # Auth credentials (set via environment variables in production)
 AUTH_USERNAME = os.environ.get("AUTH_USERNAME", "admin")
 AUTH_PASSWORD = os.environ.get("AUTH_PASSWORD", "change-me")
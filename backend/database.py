@@ -1,22 +1,49 @@
+import logging
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 
 from config import DATABASE_URL
 
+logger = logging.getLogger("database")
+
 engine = create_async_engine(DATABASE_URL, echo=False)
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_conn, connection_record):
+    """WAL lets readers run alongside the writer; NORMAL sync is safe under WAL."""
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA cache_size=-64000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.close()
+
+
 class Base(DeclarativeBase):
     pass
 
 
+# Whether the emails_fts trigram index on emails.subject is available
+_subject_fts = False
+
+
+def has_subject_fts() -> bool:
+    return _subject_fts
+
+
 async def init_db():
     async with engine.begin() as conn:
         from models import Account, Email, Group, Setting, RefreshLog  # noqa: F401
         await conn.run_sync(Base.metadata.create_all)
         # Auto-migrate: add missing columns for SQLite
         await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_add_missing_indexes)
+        await conn.run_sync(_backfill_client_id)
+        await conn.run_sync(_setup_subject_fts)
 
 
 def _add_missing_columns(conn):
@@ -62,6 +89,70 @@ def _add_missing_columns(conn):
                 conn.execute(text(f"ALTER TABLE groups ADD COLUMN {col} {dtype}"))
 
 
+def _add_missing_indexes(conn):
+    """Create model indexes on tables that predate them (create_all skips existing tables)."""
+    from sqlalchemy import text
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+    # Superseded by ix_emails_account_received, which leads with account_id
+    conn.execute(text("DROP INDEX IF EXISTS ix_emails_account_id"))
+
+
+def _backfill_client_id(conn):
+    """Give accounts saved without a client_id the shared DEFAULT_CLIENT_ID.
+
+    New and edited accounts get it on write, so readers can use
+    account.client_id directly instead of re-applying the fallback.
+    """
+    from sqlalchemy import text
+    from config import DEFAULT_CLIENT_ID
+    if not DEFAULT_CLIENT_ID:
+        return
+    conn.execute(
+        text("UPDATE accounts SET client_id = :cid WHERE client_id IS NULL OR client_id = ''"),
+        {"cid": DEFAULT_CLIENT_ID},
+    )
+
+
+def _setup_subject_fts(conn):
+    """Mirror emails.subject into an FTS5 trigram index (SQLite >= 3.34).
+
+    The trigram tokenizer keeps ILIKE '%kw%' substring semantics (including
+    CJK text) while letting searches use the index instead of a full scan.
+    """
+    global _subject_fts
+    from sqlalchemy import text
+    try:
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'emails_fts'"
+        )).first()
+        if not exists:
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE emails_fts USING fts5("
+                "subject, content='emails', content_rowid='id', tokenize='trigram')"
+            ))
+            # Index emails saved before the FTS table existed
+            conn.execute(text("INSERT INTO emails_fts(emails_fts) VALUES ('rebuild')"))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS emails_fts_ai AFTER INSERT ON emails BEGIN "
+            "INSERT INTO emails_fts(rowid, subject) VALUES (new.id, new.subject); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS emails_fts_ad AFTER DELETE ON emails BEGIN "
+            "INSERT INTO emails_fts(emails_fts, rowid, subject) VALUES ('delete', old.id, old.subject); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS emails_fts_au AFTER UPDATE OF subject ON emails BEGIN "
+            "INSERT INTO emails_fts(emails_fts, rowid, subject) VALUES ('delete', old.id, old.subject); "
+            "INSERT INTO emails_fts(rowid, subject) VALUES (new.id, new.subject); END"
+        ))
+        _subject_fts = True
+    except Exception as e:
+        logger.warning(f"主题全文索引不可用，使用 LIKE 搜索: {e}")
+        _subject_fts = False
+
+
 async def get_session():
     async with async_session() as session:
         yield session
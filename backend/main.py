@@ -20,7 +20,12 @@ from routes.emails import router as emails_router
 from routes.groups import router as groups_router
 from routes.settings import router as settings_router
 from routes.refresh import router as refresh_router
-from scheduler import start_scheduler, stop_scheduler, new_email_events, get_sync_status, get_sync_log
+from routes.refresh import publish_tokens
+from sse import SSE_PING, SSE_PING_SECONDS, sse_event, sse_response
+from scheduler import (
+    start_scheduler, stop_scheduler, new_email_events, get_sync_status, get_sync_log,
+    subscribe_sync_log,
+)
 from config import AUTH_USERNAME, AUTH_PASSWORD, AUTH_SECRET, DEFAULT_CLIENT_ID
 
 logging.basicConfig(level=logging.INFO)
@@ -59,7 +64,7 @@ async def lifespan(app: FastAPI):
     # Startup
     await init_db()
     logger.info("数据库初始化完成")
-    start_scheduler()
+    await start_scheduler()
     yield
     # Shutdown
     stop_scheduler()
@@ -114,14 +119,11 @@ async def login(request: Request):
     # Check password from settings first, then env
     current_password = AUTH_PASSWORD
     try:
-        from models import Setting
+        from routes.settings import load_settings
         async with async_session() as session:
-            result = await session.execute(
-                select(Setting).where(Setting.key == "auth_password")
-            )
-            setting = result.scalar_one_or_none()
-            if setting and setting.value:
-                current_password = setting.value
+            stored = (await load_settings(session)).get("auth_password")
+            if stored:
+                current_password = stored
     except Exception:
         pass
 
@@ -201,6 +203,7 @@ async def device_code_poll(account_id: int):
             account.status = "active"
             account.last_error = None
             await session.commit()
+            publish_tokens([account])
             logger.info(f"✅ Account {account_id} authorized successfully")
     except HTTPException:
         raise
@@ -254,7 +257,18 @@ async def sync_status():
 @app.get("/api/sync-log")
 async def sync_log_endpoint():
     """Return recent sync log entries."""
-    return get_sync_log()
+    return await get_sync_log()
+
+
+@app.get("/api/sync-log/stream")
+async def sync_log_stream():
+    """SSE stream of sync log entries as they are added (this process only)."""
+    async def event_generator():
+        async for entry in subscribe_sync_log(SSE_PING_SECONDS):
+            # None means the log was idle: send a keep-alive comment
+            yield SSE_PING if entry is None else sse_event(entry)
+
+    return sse_response(event_generator())
 
 
 # Serve frontend static files in production
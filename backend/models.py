@@ -65,10 +65,14 @@ class Email(Base):
         UniqueConstraint("account_id", "message_id", name="uq_account_message"),
         Index("ix_emails_subject", "subject"),
         Index("ix_emails_received_at", "received_at"),
+        # Per-account listing: WHERE account_id = ? ORDER BY received_at DESC, id DESC.
+        # SQLite stores the rowid (id) in every index entry and scans it backwards for DESC,
+        # so this also serves as the account_id index.
+        Index("ix_emails_account_received", "account_id", "received_at"),
     )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), nullable=False, index=True)
+    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), nullable=False)
     message_id = Column(String(255), nullable=False)
     subject = Column(String(500), nullable=True)
     sender_name = Column(String(255), nullable=True)
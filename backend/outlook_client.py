@@ -4,6 +4,7 @@ import imaplib
 import poplib
 import email
 import base64
+import html
 import logging
 from datetime import datetime, timedelta
 from email.header import decode_header
@@ -34,6 +35,22 @@ IMAP_FOLDER_MAP = {
 }
 
 
+# Connection pool limits shared by every HTTP client
+HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+
+# Pooled HTTP clients keyed by proxy_url, reused across requests
+_client_cache: Dict[str, httpx.AsyncClient] = {}
+
+# Graph $batch: max sub-requests per call, and how long detail fetches wait to be coalesced
+GRAPH_BATCH_MAX = 20
+GRAPH_BATCH_WINDOW = 0.01
+
+# Concurrent single DELETEs when a $batch call is rejected
+DELETE_FALLBACK_CONCURRENCY = 10
+
+DETAIL_SELECT = "$select=id,subject,from,toRecipients,receivedDateTime,isRead,body,hasAttachments"
+
+
 class ProxyError(Exception):
     """Raised when a proxy connection fails."""
     pass
@@ -57,23 +74,62 @@ class OutlookClient:
     """Wrapper for Microsoft Graph API + IMAP/POP3 to read Outlook emails."""
 
     def __init__(self):
-        self._http = httpx.AsyncClient(timeout=30.0)
+        self._http = httpx.AsyncClient(timeout=30.0, limits=HTTP_LIMITS)
+        # Detail fetches waiting to be batched: {(access_token, proxy_url): [(message_id, future)]}
+        self._detail_pending: Dict[tuple, list] = {}
+        # Strong refs to in-flight flush tasks; the loop only keeps weak ones
+        self._detail_tasks: set = set()
+        # Token refreshes in flight, shared by concurrent callers: {(client_id, refresh_token): task}
+        self._refresh_inflight: Dict[tuple, asyncio.Future] = {}
 
     async def close(self):
         await self._http.aclose()
+        for client in _client_cache.values():
+            await client.aclose()
+        _client_cache.clear()
 
     def _get_http_client(self, proxy_url: str = None) -> httpx.AsyncClient:
-        """Get an HTTP client, optionally with proxy."""
-        if proxy_url:
-            return httpx.AsyncClient(timeout=30.0, proxy=proxy_url)
-        return self._http
+        """Get a pooled HTTP client, optionally with proxy (one client per proxy_url)."""
+        if not proxy_url:
+            return self._http
+        client = _client_cache.get(proxy_url)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(timeout=30.0, proxy=proxy_url, limits=HTTP_LIMITS)
+            _client_cache[proxy_url] = client
+        return client
+
+    async def probe_graph(self, proxy_url: str = None, timeout: float = 10.0) -> int:
+        """Hit the Graph service root over the pooled client; returns the HTTP status.
+        The root answers with a few hundred bytes, unlike the multi-MB $metadata document.
+        """
+        client = self._get_http_client(proxy_url)
+        resp = await client.get(f"{MS_GRAPH_BASE}/", timeout=timeout)
+        return resp.status_code
 
     # ── Token Management ─────────────────────────────────
 
     async def refresh_access_token(
         self, client_id: str, refresh_token: str, proxy_url: str = None
     ) -> dict:
-        """Exchange refresh_token for a new access_token (Graph API scope)."""
+        """Exchange refresh_token for a new access_token (Graph API scope).
+
+        Concurrent calls with the same refresh token share one request, so a
+        rotated refresh token is never redeemed twice.
+        """
+        key = (client_id, refresh_token)
+        task = self._refresh_inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(
+                self._refresh_access_token(client_id, refresh_token, proxy_url)
+            )
+            self._refresh_inflight[key] = task
+            task.add_done_callback(lambda _: self._refresh_inflight.pop(key, None))
+        # shield: one caller giving up must not cancel the request for the others
+        return await asyncio.shield(task)
+
+    async def _refresh_access_token(
+        self, client_id: str, refresh_token: str, proxy_url: str = None
+    ) -> dict:
         data = {
             "client_id": client_id,
             "grant_type": "refresh_token",
@@ -94,9 +150,6 @@ class OutlookClient:
             if proxy_url:
                 raise ProxyError(f"代理连接错误: {e}")
             raise
-        finally:
-            if proxy_url and client is not self._http:
-                await client.aclose()
 
     async def _get_imap_token_old(self, client_id: str, refresh_token: str) -> Optional[str]:
         """旧版：通过 login.live.com 获取 access_token（无需 scope）"""
@@ -191,37 +244,105 @@ class OutlookClient:
         skip: int = 0,
         folder: str = "inbox",
         proxy_url: str = None,
+        include_unread_count: bool = False,
     ) -> Dict[str, Any]:
-        """Fetch email list via Graph API."""
-        url = (
-            f"{MS_GRAPH_BASE}/me/mailFolders/{folder}/messages"
+        """Fetch email list via Graph API.
+
+        With include_unread_count, the folder's unread count is fetched in the
+        same $batch call and returned as "unread_count" (0 if unavailable).
+        """
+        path = (
+            f"/me/mailFolders/{folder}/messages"
             f"?$top={top}&$skip={skip}"
             f"&$select=id,subject,from,receivedDateTime,isRead,bodyPreview,body"
             f"&$orderby=receivedDateTime desc"
             f"&$count=true"
         )
+        if include_unread_count:
+            messages, folder_info = await self._graph_batch(access_token, [
+                {"method": "GET", "url": path, "headers": {"ConsistencyLevel": "eventual"}},
+                {"method": "GET", "url": f"/me/mailFolders/{folder}?$select=unreadItemCount"},
+            ], proxy_url=proxy_url)
+            if messages.get("status") != 200:
+                err = (messages.get("body") or {}).get("error", {})
+                raise Exception(f"Graph {messages.get('status')}: {err.get('message', '')[:200]}")
+            data = messages.get("body") or {}
+            unread = (folder_info.get("body") or {}) if folder_info.get("status") == 200 else {}
+            data["unread_count"] = unread.get("unreadItemCount", 0)
+            return data
+
+        # ConsistencyLevel makes Graph populate @odata.count reliably
+        headers = {**self._headers(access_token), "ConsistencyLevel": "eventual"}
         client = self._get_http_client(proxy_url)
         try:
-            resp = await client.get(url, headers=self._headers(access_token))
+            resp = await client.get(f"{MS_GRAPH_BASE}{path}", headers=headers)
             resp.raise_for_status()
             return resp.json()
         except (httpx.ProxyError, httpx.ConnectError) as e:
             if proxy_url:
                 raise ProxyError(f"代理连接错误: {e}")
             raise
-        finally:
-            if proxy_url and client is not self._http:
-                await client.aclose()
 
     async def fetch_email_detail(
         self, access_token: str, message_id: str, proxy_url: str = None
     ) -> Dict[str, Any]:
-        """Fetch a single email with full body via Graph API."""
-        url = (
-            f"{MS_GRAPH_BASE}/me/messages/{message_id}"
-            f"?$select=id,subject,from,toRecipients,receivedDateTime,"
-            f"isRead,body,hasAttachments"
-        )
+        """Fetch a single email with full body via Graph API.
+
+        Concurrent calls for the same mailbox are coalesced for
+        GRAPH_BATCH_WINDOW seconds and sent as one Graph $batch request;
+        a lone call is sent straight away.
+        """
+        key = (access_token, proxy_url)
+        fut = asyncio.get_running_loop().create_future()
+        pending = self._detail_pending.setdefault(key, [])
+        pending.append((message_id, fut))
+        if len(pending) == 1:
+            task = asyncio.create_task(self._flush_detail_batch(key))
+            self._detail_tasks.add(task)
+            task.add_done_callback(self._detail_tasks.discard)
+        return await fut
+
+    async def _flush_detail_batch(self, key: tuple):
+        # One loop turn lets calls made in the same tick join; only wait out
+        # the window when there is something to batch with
+        await asyncio.sleep(0)
+        if len(self._detail_pending.get(key, ())) > 1:
+            await asyncio.sleep(GRAPH_BATCH_WINDOW)
+        access_token, proxy_url = key
+        pending = self._detail_pending.pop(key, [])
+        for i in range(0, len(pending), GRAPH_BATCH_MAX):
+            chunk = pending[i:i + GRAPH_BATCH_MAX]
+            try:
+                if len(chunk) == 1:
+                    results = [await self._fetch_email_detail_one(
+                        access_token, chunk[0][0], proxy_url)]
+                else:
+                    responses = await self._graph_batch(access_token, [
+                        {"method": "GET", "url": f"/me/messages/{mid}?{DETAIL_SELECT}"}
+                        for mid, _ in chunk
+                    ], proxy_url=proxy_url)
+                    results = []
+                    for r in responses:
+                        if r.get("status") == 200:
+                            results.append(r.get("body") or {})
+                        else:
+                            err = (r.get("body") or {}).get("error", {})
+                            results.append(Exception(
+                                f"Graph {r.get('status')}: {err.get('message', '')[:200]}"))
+            except Exception as e:
+                results = [e] * len(chunk)
+            for (_, fut), result in zip(chunk, results):
+                if fut.done():
+                    continue
+                if isinstance(result, Exception):
+                    fut.set_exception(result)
+                else:
+                    fut.set_result(result)
+
+    async def _fetch_email_detail_one(
+        self, access_token: str, message_id: str, proxy_url: str = None
+    ) -> Dict[str, Any]:
+        url = f"{MS_GRAPH_BASE}/me/messages/{message_id}?{DETAIL_SELECT}"
         client = self._get_http_client(proxy_url)
         try:
             resp = await client.get(url, headers=self._headers(access_token))
@@ -231,9 +352,29 @@ class OutlookClient:
             if proxy_url:
                 raise ProxyError(f"代理连接错误: {e}")
             raise
-        finally:
-            if proxy_url and client is not self._http:
-                await client.aclose()
+
+    async def _graph_batch(
+        self, access_token: str, requests: List[dict], proxy_url: str = None
+    ) -> List[dict]:
+        """POST up to GRAPH_BATCH_MAX sub-requests to Graph $batch.
+        Returns the sub-responses in request order.
+        """
+        payload = {"requests": [
+            {"id": str(i), **req} for i, req in enumerate(requests)
+        ]}
+        client = self._get_http_client(proxy_url)
+        try:
+            resp = await client.post(
+                f"{MS_GRAPH_BASE}/$batch", json=payload,
+                headers=self._headers(access_token),
+            )
+            resp.raise_for_status()
+        except (httpx.ProxyError, httpx.ConnectError) as e:
+            if proxy_url:
+                raise ProxyError(f"代理连接错误: {e}")
+            raise
+        by_id = {r.get("id"): r for r in resp.json().get("responses", [])}
+        return [by_id.get(str(i), {"status": 0}) for i in range(len(requests))]
 
     async def delete_email(
         self, access_token: str, message_id: str, proxy_url: str = None
@@ -248,9 +389,52 @@ class OutlookClient:
             if proxy_url:
                 raise ProxyError(f"代理连接错误: {e}")
             raise
-        finally:
-            if proxy_url and client is not self._http:
-                await client.aclose()
+
+    async def batch_delete_emails(
+        self, access_token: str, message_ids: List[str], proxy_url: str = None
+    ) -> List[bool]:
+        """Delete emails via Graph $batch, GRAPH_BATCH_MAX per call.
+        Returns a success flag per message_id, in order.
+        """
+        chunks = [
+            message_ids[i:i + GRAPH_BATCH_MAX]
+            for i in range(0, len(message_ids), GRAPH_BATCH_MAX)
+        ]
+        results = await asyncio.gather(*(
+            self._graph_batch(
+                access_token,
+                [{"method": "DELETE", "url": f"/me/messages/{mid}"} for mid in chunk],
+                proxy_url,
+            )
+            for chunk in chunks
+        ), return_exceptions=True)
+
+        flags: List[bool] = []
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, ProxyError):
+                raise result
+            if isinstance(result, Exception):
+                # $batch unavailable: fall back to concurrent per-id DELETEs
+                flags.extend(await self._delete_each(access_token, chunk, proxy_url))
+            else:
+                flags.extend(r.get("status") in (200, 204) for r in result)
+        return flags
+
+    async def _delete_each(
+        self, access_token: str, message_ids: List[str], proxy_url: str = None
+    ) -> List[bool]:
+        sem = asyncio.Semaphore(DELETE_FALLBACK_CONCURRENCY)
+
+        async def _one(mid: str) -> bool:
+            async with sem:
+                try:
+                    return await self.delete_email(access_token, mid, proxy_url=proxy_url)
+                except ProxyError:
+                    raise
+                except Exception:
+                    return False
+
+        return list(await asyncio.gather(*(_one(mid) for mid in message_ids)))
 
     async def get_unread_count(self, access_token: str, proxy_url: str = None) -> int:
         """Get unread email count via Graph API."""
@@ -263,9 +447,6 @@ class OutlookClient:
             return data.get("unreadItemCount", 0)
         except Exception:
             return 0
-        finally:
-            if proxy_url and client is not self._http:
-                await client.aclose()
 
     # ── IMAP Email Operations ─────────────────────────────
 
@@ -419,7 +600,7 @@ class OutlookClient:
                     elif body_html:
                         body_preview = body_html[:200]
 
-                    final_html = body_html or (f"<pre>{body_plain}</pre>" if body_plain else None)
+                    final_html = body_html or ("<pre>" + html.escape(body_plain, quote=False) + "</pre>" if body_plain else None)
 
                     result_emails.append({
                         "id": msg_id_str,
@@ -573,7 +754,7 @@ class OutlookClient:
                 except Exception:
                     pass
 
-            final_html = body_html or (f"<pre>{body_plain}</pre>" if body_plain else None)
+            final_html = body_html or ("<pre>" + html.escape(body_plain, quote=False) + "</pre>" if body_plain else None)
 
             return {
                 "id": target_message_id,
@@ -659,9 +840,6 @@ class OutlookClient:
         except Exception as e:
             logger.warning(f"Graph API check error: {e}")
             return False
-        finally:
-            if proxy_url and client is not self._http:
-                await client.aclose()
 
 
 # Singleton
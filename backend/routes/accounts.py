@@ -1,10 +1,14 @@
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import noload
 from datetime import datetime, timedelta
 from typing import List
 
+from config import DEFAULT_CLIENT_ID
 from database import get_session
 from models import Account, Group
 from schemas import (
@@ -16,52 +20,62 @@ from schemas import (
     BatchImportResult,
 )
 from outlook_client import outlook_client
+from routes.emails import invalidate_account_cache
+from routes.refresh import apply_token, fetch_token, publish_tokens
 
 router = APIRouter(prefix="/api/accounts", tags=["accounts"])
 
+# Max accounts checked concurrently by batch-check-protocols
+PROTOCOL_CHECK_CONCURRENCY = 5
+
 
 @router.get("", response_model=List[AccountResponse])
 async def list_accounts(
     group_id: int = None,
     session: AsyncSession = Depends(get_session),
 ):
-    q = select(Account)
+    # Group names come from one id → name map instead of the Account.group
+    # selectin load, which would also pull every group's accounts back in.
+    q = select(Account).options(noload(Account.group))
     if group_id is not None:
         q = q.where(Account.group_id == group_id)
     q = q.order_by(Account.created_at.asc())
-    result = await session.execute(q)
-    accounts = result.scalars().all()
+    accounts = (await session.scalars(q)).all()
+    group_names = dict((await session.execute(select(Group.id, Group.name))).all())
     out = []
     for a in accounts:
         resp = AccountResponse.model_validate(a)
-        resp.group_name = a.group.name if a.group else None
+        resp.group_name = group_names.get(a.group_id)
         out.append(resp)
     return out
 
 
+def _is_duplicate_email(e: IntegrityError) -> bool:
+    """Whether the failed constraint is the UNIQUE on accounts.email (SQLite wording)."""
+    return "UNIQUE constraint failed: accounts.email" in str(e.orig)
+
+
 @router.post("", response_model=AccountResponse)
 async def add_account(
     payload: AccountCreate, session: AsyncSession = Depends(get_session)
 ):
-    from config import DEFAULT_CLIENT_ID
-
-    # Check duplicate
-    existing = await session.execute(
-        select(Account).where(Account.email == payload.email)
-    )
-    if existing.scalar_one_or_none():
-        raise HTTPException(400, f"账号 {payload.email} 已存在")
-
     account = Account(
         email=payload.email,
         password=payload.password,
-        client_id=payload.client_id or DEFAULT_CLIENT_ID,
+        client_id=payload.client_id or DEFAULT_CLIENT_ID or None,
         refresh_token=payload.refresh_token,
         group_id=payload.group_id,
         remark=payload.remark,
     )
     session.add(account)
-    await session.commit()
+    # Rely on the UNIQUE constraint on email instead of a pre-SELECT
+    try:
+        await session.commit()
+    except IntegrityError as e:
+        await session.rollback()
+        if not _is_duplicate_email(e):
+            raise
+        raise HTTPException(400, f"账号 {payload.email} 已存在")
     await session.refresh(account)
     resp = AccountResponse.model_validate(account)
     resp.group_name = account.group.name if account.group else None
@@ -112,7 +126,7 @@ async def batch_import(
         account = Account(
             email=email_addr,
             password=password,
-            client_id=client_id or None,
+            client_id=client_id or DEFAULT_CLIENT_ID or None,
             refresh_token=refresh_token or None,
             group_id=payload.group_id,
             remark=remark,
@@ -136,6 +150,7 @@ async def delete_account(
         raise HTTPException(404, "账号不存在")
     await session.delete(account)
     await session.commit()
+    invalidate_account_cache(account_id)
     return {"message": "已删除"}
 
 
@@ -165,13 +180,14 @@ async def update_account(
     if payload.password is not None:
         account.password = payload.password
     if payload.client_id is not None:
-        account.client_id = payload.client_id if payload.client_id else None
+        account.client_id = payload.client_id or DEFAULT_CLIENT_ID or None
     if payload.refresh_token is not None:
         account.refresh_token = payload.refresh_token if payload.refresh_token else None
     if payload.remark is not None:
         account.remark = payload.remark if payload.remark else None
 
     await session.commit()
+    invalidate_account_cache(account_id)
     await session.refresh(account)
     resp = AccountResponse.model_validate(account)
     resp.group_name = account.group.name if account.group else None
@@ -191,6 +207,7 @@ async def update_account_group(
         raise HTTPException(404, "账号不存在")
     account.group_id = payload.group_id
     await session.commit()
+    invalidate_account_cache(account_id)
     return {"message": "分组已更新"}
 
 
@@ -205,13 +222,14 @@ async def batch_update_group(
     if not account_ids:
         raise HTTPException(400, "请选择账号")
 
-    result = await session.execute(
+    accounts = (await session.scalars(
         select(Account).where(Account.id.in_(account_ids))
-    )
-    accounts = result.scalars().all()
+    )).all()
     for a in accounts:
         a.group_id = group_id
     await session.commit()
+    for a in accounts:
+        invalidate_account_cache(a.id)
     return {"message": f"已移动 {len(accounts)} 个账号"}
 
 
@@ -237,6 +255,8 @@ async def sync_account(
         if grp and grp.proxy_url:
             proxy_url = grp.proxy_url
 
+    # Tokens a refresh below sets are published once committed
+    token_before = account.access_token
     try:
         account.status = "syncing"
         await session.commit()
@@ -318,6 +338,8 @@ async def sync_account(
         account.last_synced = datetime.utcnow()
         account.last_error = None
         await session.commit()
+        if account.access_token != token_before:
+            publish_tokens([account])
 
         method_labels = {"graph": "Graph API", "imap_new": "IMAP (新版)", "imap_old": "IMAP (旧版)"}
         return {
@@ -335,10 +357,31 @@ async def sync_account(
         account.status = "error"
         account.last_error = str(e)[:500]
         await session.commit()
+        if account.access_token != token_before:
+            publish_tokens([account])
         raise HTTPException(500, f"同步失败: {str(e)[:200]}")
 
 
-@router.get("/export", response_class=PlainTextResponse)
+def _render_export_line(a: Account) -> str:
+    return f"{a.email}----{a.password}----{a.client_id or ''}----{a.refresh_token or ''}----{a.remark or ''}"
+
+
+def _export_lines(accounts):
+    # Same bytes as "\n".join(...): newline between lines, none after the last
+    for i, a in enumerate(accounts):
+        yield ("\n" if i else "").encode() + _render_export_line(a).encode()
+
+
+def _export_response(accounts) -> StreamingResponse:
+    """Stream export lines instead of joining them into one big string."""
+    return StreamingResponse(
+        _export_lines(accounts),
+        media_type="text/plain; charset=utf-8",
+        headers={"Content-Disposition": "attachment; filename=accounts_export.txt"},
+    )
+
+
+@router.get("/export", response_class=StreamingResponse)
 async def export_accounts(
     group_id: int = Query(None),
     session: AsyncSession = Depends(get_session),
@@ -348,21 +391,12 @@ async def export_accounts(
     if group_id is not None:
         q = q.where(Account.group_id == group_id)
     q = q.order_by(Account.created_at.asc())
-    result = await session.execute(q)
-    accounts = result.scalars().all()
+    accounts = (await session.scalars(q)).all()
 
-    lines = []
-    for a in accounts:
-        line = f"{a.email}----{a.password}----{a.client_id or ''}----{a.refresh_token or ''}----{a.remark or ''}"
-        lines.append(line)
-
-    return PlainTextResponse(
-        "\n".join(lines),
-        headers={"Content-Disposition": "attachment; filename=accounts_export.txt"}
-    )
+    return _export_response(accounts)
 
 
-@router.post("/export-selected", response_class=PlainTextResponse)
+@router.post("/export-selected", response_class=StreamingResponse)
 async def export_selected_accounts(
     payload: dict,
     session: AsyncSession = Depends(get_session),
@@ -372,20 +406,25 @@ async def export_selected_accounts(
     if not account_ids:
         raise HTTPException(400, "请选择要导出的账号")
 
-    result = await session.execute(
+    accounts = (await session.scalars(
         select(Account).where(Account.id.in_(account_ids)).order_by(Account.created_at.asc())
-    )
-    accounts = result.scalars().all()
+    )).all()
 
-    lines = []
-    for a in accounts:
-        line = f"{a.email}----{a.password}----{a.client_id or ''}----{a.refresh_token or ''}----{a.remark or ''}"
-        lines.append(line)
+    return _export_response(accounts)
 
-    return PlainTextResponse(
-        "\n".join(lines),
-        headers={"Content-Disposition": "attachment; filename=accounts_export.txt"}
-    )
+
+async def _apply_graph_probe(account: Account, proxy_url: str = None):
+    """Refresh the account's token and check Graph API access with it.
+
+    Goes through fetch_token, so it shares the per-account refresh lock; a new
+    token is only set on the account, for the caller to commit and publish.
+    """
+    token_data, _ = await fetch_token(account, proxy_url)
+    if token_data is None:
+        account.graph_enabled = False
+        return
+    apply_token(account, token_data)
+    account.graph_enabled = await outlook_client.check_graph(account.access_token, proxy_url=proxy_url)
 
 
 @router.post("/{account_id}/check-protocols")
@@ -400,22 +439,10 @@ async def check_protocols(
     if not account:
         raise HTTPException(404, "账号不存在")
 
+    token_before = account.access_token
     try:
         # Check Graph (needs refresh_token)
-        access_token = None
-        if account.refresh_token and account.client_id:
-            try:
-                token_data = await outlook_client.refresh_access_token(
-                    account.client_id, account.refresh_token
-                )
-                access_token = token_data["access_token"]
-                account.access_token = access_token
-                account.refresh_token = token_data["refresh_token"]
-                account.graph_enabled = await outlook_client.check_graph(access_token)
-            except Exception:
-                account.graph_enabled = False
-        else:
-            account.graph_enabled = False
+        await _apply_graph_probe(account)
 
         # Check IMAP/POP3
         account.imap_enabled = await outlook_client.check_imap(
@@ -424,6 +451,8 @@ async def check_protocols(
             account.email, account.password, account.client_id, account.refresh_token)
 
         await session.commit()
+        if account.access_token != token_before:
+            publish_tokens([account])
 
         return {
             "imap_enabled": account.imap_enabled,
@@ -432,6 +461,8 @@ async def check_protocols(
         }
     except Exception as e:
         await session.commit()
+        if account.access_token != token_before:
+            publish_tokens([account])
         raise HTTPException(500, f"检测失败: {str(e)[:200]}")
 
 
@@ -445,43 +476,36 @@ async def batch_check_protocols(
     if not account_ids:
         raise HTTPException(400, "请选择账号")
 
-    result = await session.execute(
+    accounts = (await session.scalars(
         select(Account).where(Account.id.in_(account_ids))
-    )
-    accounts = result.scalars().all()
+    )).all()
+
+    sem = asyncio.Semaphore(PROTOCOL_CHECK_CONCURRENCY)
+    tokens_before = {a.id: a.access_token for a in accounts}
 
-    results = []
-    for account in accounts:
+    async def _check_one(account: Account) -> dict:
         item = {"id": account.id, "email": account.email}
-        try:
-            # Check Graph
-            if account.refresh_token and account.client_id:
-                try:
-                    token_data = await outlook_client.refresh_access_token(
-                        account.client_id, account.refresh_token
-                    )
-                    access_token = token_data["access_token"]
-                    account.access_token = access_token
-                    account.refresh_token = token_data["refresh_token"]
-                    account.graph_enabled = await outlook_client.check_graph(access_token)
-                except Exception:
-                    account.graph_enabled = False
-            else:
-                account.graph_enabled = False
-
-            # Check IMAP/POP3
-            account.imap_enabled = await outlook_client.check_imap(
-                account.email, account.password, account.client_id, account.refresh_token)
-            account.pop3_enabled = await outlook_client.check_pop3(
-                account.email, account.password, account.client_id, account.refresh_token)
-
-            item["imap_enabled"] = account.imap_enabled
-            item["pop3_enabled"] = account.pop3_enabled
-            item["graph_enabled"] = account.graph_enabled
-        except Exception as e:
-            item["error"] = str(e)[:200]
-
-        results.append(item)
+        async with sem:
+            try:
+                # Check Graph
+                await _apply_graph_probe(account)
+
+                # Check IMAP/POP3
+                account.imap_enabled = await outlook_client.check_imap(
+                    account.email, account.password, account.client_id, account.refresh_token)
+                account.pop3_enabled = await outlook_client.check_pop3(
+                    account.email, account.password, account.client_id, account.refresh_token)
+
+                item["imap_enabled"] = account.imap_enabled
+                item["pop3_enabled"] = account.pop3_enabled
+                item["graph_enabled"] = account.graph_enabled
+            except Exception as e:
+                item["error"] = str(e)[:200]
+        return item
+
+    # Accounts are already loaded, so checks only touch the network, not the session
+    results = await asyncio.gather(*(_check_one(a) for a in accounts))
 
     await session.commit()
+    publish_tokens(a for a in accounts if a.access_token != tokens_before[a.id])
     return {"results": results}
@@ -1,74 +1,400 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from typing import Optional
+from sqlalchemy import Integer, bindparam, column, or_, select, func, text, update
+from sqlalchemy.orm import load_only, make_transient_to_detached, noload
+from sqlalchemy.orm.attributes import set_committed_value
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
-
-from database import get_session
+import asyncio
+import base64
+import hashlib
+import html
+import time
+
+from config import TOKEN_REFRESH_SKEW_SECONDS
+from database import get_session, has_subject_fts
 from models import Account, Email, Group
 from schemas import EmailSummary, EmailDetail, EmailListResponse, EmailAddress, LocalEmailSummary, SearchEmailResponse
 from outlook_client import outlook_client, ProxyError
+import token_cache
+
+router = APIRouter(prefix="/api", tags=["emails"], default_response_class=ORJSONResponse)
+
+# Short-lived cache of account column values: {account_id: (expires_at, values)}
+ACCOUNT_CACHE_TTL = 60
+_account_cache: Dict[int, Tuple[float, dict]] = {}
+
+# Serializers built once; list/detail endpoints return pre-encoded JSON
+# (response_model is kept for the OpenAPI schema only)
+_LIST_ADAPTER = TypeAdapter(EmailListResponse)
+_DETAIL_ADAPTER = TypeAdapter(EmailDetail)
+
+# Graph list pages, served and prefetched: {(account_id, folder, skip, top): (expires_at, response)}
+LIST_CACHE_TTL = 20
+PREFETCH_TTL = 30
+_page_cache: Dict[tuple, Tuple[float, EmailListResponse]] = {}
+
+# Group proxy URLs: {group_id: (expires_at, proxy_url)}
+PROXY_CACHE_TTL = 60
+_proxy_cache: Dict[int, Tuple[float, Optional[str]]] = {}
 
-router = APIRouter(prefix="/api", tags=["emails"])
+# Search result totals, reused while paging: {(keyword, account_email, group_id): (expires_at, total)}
+SEARCH_TOTAL_TTL = 30
+_search_total_cache: Dict[tuple, Tuple[float, int]] = {}
+
+# Max seconds to wait for the Graph message list before trying IMAP
+GRAPH_LIST_TIMEOUT_SECONDS = 3.0
 
 
 # ── Helper ──────────────────────────────────────────────
 
+def _cache_account(account: Account):
+    """Snapshot the account's columns into the cache."""
+    values = {c.key: getattr(account, c.key) for c in Account.__table__.columns}
+    _account_cache[account.id] = (time.monotonic() + ACCOUNT_CACHE_TTL, values)
+
+
+def invalidate_account_cache(account_id: int):
+    """Drop a cached account, e.g. after it was edited or deleted."""
+    _account_cache.pop(account_id, None)
+
+
+async def _get_account(session: AsyncSession, account_id: int) -> Optional[Account]:
+    """Load an account, reusing a recent snapshot instead of a SELECT when possible."""
+    cached = _account_cache.get(account_id)
+    if cached and cached[0] > time.monotonic():
+        account = Account(**cached[1])
+        make_transient_to_detached(account)
+        session.add(account)
+        return account
+
+    account = await session.get(Account, account_id)
+    if account:
+        _cache_account(account)
+    return account
+
+
+def _token_valid(access_token: Optional[str], expires_at: Optional[datetime]) -> bool:
+    """True if the token won't expire within TOKEN_REFRESH_SKEW_SECONDS."""
+    skew = timedelta(seconds=TOKEN_REFRESH_SKEW_SECONDS)
+    return bool(access_token and expires_at and expires_at > datetime.utcnow() + skew)
+
+
 async def _ensure_token(account: Account, session: AsyncSession, proxy_url: str = None):
     """Make sure access_token is valid; refresh if expired or missing."""
-    needs_refresh = (
-        not account.access_token
-        or not account.token_expires_at
-        or account.token_expires_at <= datetime.utcnow()
-    )
-    if needs_refresh:
-        token_data = await outlook_client.refresh_access_token(
-            account.client_id, account.refresh_token, proxy_url=proxy_url
-        )
+    if _token_valid(account.access_token, account.token_expires_at):
+        return
+    if _apply_cached_token(account):
+        return
+
+    # Only one request per account refreshes; the others wait and reuse its token
+    async with token_cache.refresh_lock(account.id):
+        if _apply_cached_token(account):
+            return
+
+        try:
+            token_data = await outlook_client.refresh_access_token(
+                account.client_id, account.refresh_token, proxy_url=proxy_url
+            )
+        except Exception:
+            invalidate_account_cache(account.id)
+            token_cache.drop(account.id)
+            raise
         account.access_token = token_data["access_token"]
         account.refresh_token = token_data["refresh_token"]
         account.token_expires_at = datetime.utcnow() + timedelta(
             seconds=token_data["expires_in"]
         )
         await session.commit()
+        token_cache.put_account(account)
+        _cache_account(account)
+
+
+def _apply_cached_token(account: Account) -> bool:
+    """Load a token refreshed and committed elsewhere onto the account, no DB write."""
+    cached = token_cache.get(account.id)
+    if not cached:
+        return False
+    for key, value in zip(("access_token", "refresh_token", "token_expires_at"), cached):
+        set_committed_value(account, key, value)
+    return True
 
 
 async def _get_proxy_url(account: Account, session: AsyncSession) -> Optional[str]:
     """Get the proxy URL from the account's group, if set."""
     if not account.group_id:
         return None
-    result = await session.execute(
-        select(Group).where(Group.id == account.group_id)
-    )
-    group = result.scalar_one_or_none()
-    return group.proxy_url if group else None
+    cached = _proxy_cache.get(account.group_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    group = await session.get(Group, account.group_id)
+    proxy_url = group.proxy_url if group else None
+    _proxy_cache[account.group_id] = (time.monotonic() + PROXY_CACHE_TTL, proxy_url)
+    return proxy_url
+
+
+def invalidate_proxy_cache(group_id: int):
+    """Drop a cached group proxy URL after the group was edited or deleted."""
+    _proxy_cache.pop(group_id, None)
 
 
+# Messages come from Graph/IMAP parsing we control, so models are built with
+# model_construct() to skip per-field validation on every row.
+
 def _parse_sender(msg: dict) -> Optional[EmailAddress]:
     fr = msg.get("from")
     if fr and fr.get("emailAddress"):
         ea = fr["emailAddress"]
-        return EmailAddress(name=ea.get("name"), address=ea.get("address", ""))
+        return EmailAddress.model_construct(name=ea.get("name"), address=ea.get("address") or "")
     return None
 
 
+def _parse_recipients(msg: dict) -> List[EmailAddress]:
+    to_list = []
+    for r in msg.get("toRecipients", []):
+        ea = r.get("emailAddress", {})
+        to_list.append(EmailAddress.model_construct(name=ea.get("name"), address=ea.get("address") or ""))
+    return to_list
+
+
+def _body_html(msg: dict) -> str:
+    body = msg.get("body", {})
+    content = body.get("content") or ""
+    if body.get("contentType") == "html":
+        return content
+    # Plain text is escaped so it can't inject markup into the viewer
+    return "<pre>" + html.escape(content, quote=False) + "</pre>"
+
+
+def _to_summaries(messages: List[dict]) -> List[EmailSummary]:
+    """Build EmailSummary rows from Graph-style messages (Graph API or IMAP).
+
+    Sender parsing is inlined and the constructors bound locally, since this
+    runs once per message on every list page.
+    """
+    summary = EmailSummary.model_construct
+    address = EmailAddress.model_construct
+    out = []
+    for m in messages:
+        ea = (m.get("from") or {}).get("emailAddress")
+        out.append(summary(
+            id=m["id"],
+            subject=m.get("subject"),
+            sender=address(name=ea.get("name"), address=ea.get("address") or "") if ea else None,
+            received_at=m.get("receivedDateTime"),
+            is_read=m.get("isRead", False),
+            preview=(m.get("bodyPreview") or "")[:200],
+        ))
+    return out
+
+
+def _to_detail(msg: dict, body_html: str) -> EmailDetail:
+    """Build an EmailDetail from a Graph-style message (Graph API or IMAP)."""
+    return EmailDetail(
+        id=msg["id"],
+        subject=msg.get("subject"),
+        sender=_parse_sender(msg),
+        to_recipients=_parse_recipients(msg),
+        received_at=msg.get("receivedDateTime"),
+        is_read=msg.get("isRead", False),
+        body_html=body_html,
+        has_attachments=msg.get("hasAttachments", False),
+    )
+
+
+# Local list pages only need the summary columns: skip body_html and the
+# selectin load of each row's Account
+_SUMMARY_ONLY = (
+    load_only(
+        Email.id, Email.message_id, Email.subject, Email.sender_name,
+        Email.sender_address, Email.received_at, Email.is_read, Email.body_preview,
+    ),
+    noload(Email.account),
+)
+
+
+def _list_response(obj: EmailListResponse) -> Response:
+    return Response(_LIST_ADAPTER.dump_json(obj), media_type="application/json")
+
+
+def _detail_response(obj: EmailDetail, headers: Optional[dict] = None) -> Response:
+    return Response(_DETAIL_ADAPTER.dump_json(obj), media_type="application/json", headers=headers)
+
+
+def _local_detail(email_record: Email, body_html: str) -> EmailDetail:
+    """Build an EmailDetail from a locally saved email."""
+    return EmailDetail(
+        id=email_record.message_id,
+        subject=email_record.subject,
+        sender=EmailAddress(
+            name=email_record.sender_name or "",
+            address=email_record.sender_address or ""
+        ),
+        to_recipients=[],
+        received_at=email_record.received_at.isoformat() if email_record.received_at else None,
+        is_read=email_record.is_read,
+        body_html=body_html,
+        has_attachments=False,
+    )
+
+
 # ── Email list: Graph API → IMAP(新) → IMAP(旧) → local DB ───
 
+async def _prefetch_page(account_id: int, access_token: str, folder: str,
+                         skip: int, top: int, proxy_url: Optional[str]):
+    """Background task: fetch the next Graph page so paging forward hits the cache."""
+    try:
+        data = await outlook_client.fetch_emails(
+            access_token, top=top, skip=skip, folder=folder, proxy_url=proxy_url
+        )
+    except Exception:
+        return
+    emails = _to_summaries(data.get("value", []))
+    if not emails:
+        return
+    total = data.get("@odata.count", len(emails))
+    _store_page(
+        (account_id, folder, skip, top),
+        EmailListResponse(emails=emails, total=total, method="Graph API"),
+        PREFETCH_TTL,
+    )
+
+
+def _store_page(key: tuple, page: EmailListResponse, ttl: float):
+    now = time.monotonic()
+    for k in [k for k, (expires_at, _) in _page_cache.items() if expires_at <= now]:
+        del _page_cache[k]
+    _page_cache[key] = (now + ttl, page)
+
+
+def _invalidate_pages(account_id: int):
+    for key in [k for k in _page_cache if k[0] == account_id]:
+        del _page_cache[key]
+
+
+def _encode_cursor(*parts) -> str:
+    """Opaque keyset cursor: the sort-key values of the last row, "|"-joined."""
+    raw = "|".join("" if p is None else p.isoformat() if isinstance(p, datetime) else str(int(p)) for p in parts)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str, n: int) -> List[str]:
+    try:
+        parts = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    except (ValueError, UnicodeDecodeError):
+        parts = []
+    if len(parts) != n:
+        raise HTTPException(400, "无效的分页游标")
+    return parts
+
+
+def _after_received(received: str, email_id: str):
+    """Rows after (received_at, id) in (received_at DESC, id DESC) order; NULL dates sort last."""
+    try:
+        email_id = int(email_id)
+        received_at = datetime.fromisoformat(received) if received else None
+    except ValueError:
+        raise HTTPException(400, "无效的分页游标")
+    if received_at is None:
+        return (Email.received_at.is_(None)) & (Email.id < email_id)
+    return or_(
+        Email.received_at < received_at,
+        (Email.received_at == received_at) & (Email.id < email_id),
+        Email.received_at.is_(None),
+    )
+
+
+async def _local_email_page(
+    session: AsyncSession, account_id: int, top: int, skip: int, cursor: Optional[str],
+) -> Tuple[List[EmailSummary], int, Optional[str]]:
+    """One page of locally saved emails: (emails, total, next_cursor)."""
+    order = (Email.received_at.desc(), Email.id.desc())
+    if cursor:
+        # Keyset page: seeks on (account_id, received_at) instead of scanning past OFFSET rows
+        q = (
+            select(Email)
+            .options(*_SUMMARY_ONLY)
+            .where(Email.account_id == account_id, _after_received(*_decode_cursor(cursor, 2)))
+            .order_by(*order)
+            .limit(top + 1)
+        )
+        db_emails = (await session.execute(q)).scalars().all()
+        total_result = await session.execute(
+            select(func.count()).where(Email.account_id == account_id)
+        )
+        total = total_result.scalar() or 0
+    else:
+        # Page + total in one query
+        q = (
+            select(Email, func.count().over().label("total"))
+            .options(*_SUMMARY_ONLY)
+            .where(Email.account_id == account_id)
+            .order_by(*order)
+            .offset(skip)
+            .limit(top + 1)
+        )
+        rows = (await session.execute(q)).all()
+        db_emails = [r[0] for r in rows]
+        if rows:
+            total = rows[0].total
+        elif skip:
+            # Page past the end: the window count has no row to ride on
+            total_result = await session.execute(
+                select(func.count()).where(Email.account_id == account_id)
+            )
+            total = total_result.scalar() or 0
+        else:
+            total = 0
+    # The extra (top + 1)th row only signals that another page exists
+    next_cursor = None
+    if len(db_emails) > top:
+        db_emails = db_emails[:top]
+        next_cursor = _encode_cursor(db_emails[-1].received_at, db_emails[-1].id)
+
+    emails = [
+        EmailSummary.model_construct(
+            id=e.message_id,
+            subject=e.subject,
+            sender=EmailAddress.model_construct(name=e.sender_name or "", address=e.sender_address or ""),
+            received_at=e.received_at.isoformat() if e.received_at else None,
+            is_read=bool(e.is_read),
+            preview=e.body_preview or "",
+        )
+        for e in db_emails
+    ]
+    return emails, total, next_cursor
+
+
 @router.get("/accounts/{account_id}/emails", response_model=EmailListResponse)
 async def list_emails(
     account_id: int,
+    background_tasks: BackgroundTasks,
     top: int = Query(30, ge=1, le=100),
     skip: int = Query(0, ge=0),
     folder: str = Query("inbox", description="邮件文件夹: inbox, junkemail, deleteditems"),
+    cursor: Optional[str] = Query(None, description="本地数据库分页游标 (next_cursor)，直接读取本地数据库，忽略 skip"),
     session: AsyncSession = Depends(get_session),
 ):
-    result = await session.execute(
-        select(Account).where(Account.id == account_id)
-    )
-    account = result.scalar_one_or_none()
+    account = await _get_account(session, account_id)
     if not account:
         raise HTTPException(404, "账号不存在")
 
+    # next_cursor only comes from a local-DB page and means nothing to Graph or
+    # IMAP, so a cursor keeps paging through the local DB
+    if cursor:
+        emails, total, next_cursor = await _local_email_page(session, account_id, top, skip, cursor)
+        return _list_response(EmailListResponse(
+            emails=emails, total=total, method="Local DB", next_cursor=next_cursor
+        ))
+
+    # Served from a recent or prefetched Graph page (rapid refresh / paging forward)
+    page_key = (account_id, folder, skip, top)
+    cached = _page_cache.get(page_key)
+    if cached and cached[0] > time.monotonic():
+        return _list_response(cached[1])
+
     proxy_url = await _get_proxy_url(account, session)
     errors = []
 
@@ -76,32 +402,36 @@ async def list_emails(
     if account.refresh_token and account.client_id and account.graph_enabled is not False:
         try:
             await _ensure_token(account, session, proxy_url=proxy_url)
-            data = await outlook_client.fetch_emails(
-                account.access_token, top=top, skip=skip,
-                folder=folder, proxy_url=proxy_url
+            # Tight timeout so a hanging Graph endpoint falls through to IMAP quickly
+            data = await asyncio.wait_for(
+                outlook_client.fetch_emails(
+                    account.access_token, top=top, skip=skip,
+                    folder=folder, proxy_url=proxy_url
+                ),
+                timeout=GRAPH_LIST_TIMEOUT_SECONDS,
             )
-            emails = []
-            for msg in data.get("value", []):
-                emails.append(
-                    EmailSummary(
-                        id=msg["id"],
-                        subject=msg.get("subject"),
-                        sender=_parse_sender(msg),
-                        received_at=msg.get("receivedDateTime"),
-                        is_read=msg.get("isRead", False),
-                        preview=msg.get("bodyPreview", "")[:200],
-                    )
-                )
+            emails = _to_summaries(data.get("value", []))
             total = data.get("@odata.count", len(emails))
-            return EmailListResponse(emails=emails, total=total, method="Graph API")
+            if skip + top < total:
+                background_tasks.add_task(
+                    _prefetch_page, account_id, account.access_token,
+                    folder, skip + top, top, proxy_url,
+                )
+            page = EmailListResponse(emails=emails, total=total, method="Graph API")
+            _store_page(page_key, page, LIST_CACHE_TTL)
+            return _list_response(page)
         except ProxyError as e:
             # Proxy error: don't fall back to IMAP
             raise HTTPException(502, f"代理连接错误: {e}")
+        except asyncio.TimeoutError:
+            # Slow, not broken: fall through without disabling Graph
+            errors.append(f"Graph API: 超时 ({GRAPH_LIST_TIMEOUT_SECONDS}s)")
         except Exception as e:
             errors.append(f"Graph API: {e}")
             # Mark graph as disabled so next request skips it
             account.graph_enabled = False
             await session.commit()
+            _cache_account(account)
 
     # ── Try IMAP ──
     if account.client_id and account.refresh_token:
@@ -111,54 +441,19 @@ async def list_emails(
                 account.client_id, account.refresh_token,
                 top=top, folder=folder
             )
-            emails = []
-            for msg in data.get("value", []):
-                emails.append(
-                    EmailSummary(
-                        id=msg["id"],
-                        subject=msg.get("subject"),
-                        sender=_parse_sender(msg),
-                        received_at=msg.get("receivedDateTime"),
-                        is_read=msg.get("isRead", False),
-                        preview=msg.get("bodyPreview", "")[:200],
-                    )
-                )
+            emails = _to_summaries(data.get("value", []))
             total = data.get("@odata.count", len(emails))
             method = data.get("_method", "IMAP")
-            return EmailListResponse(emails=emails, total=total, method=method)
+            return _list_response(EmailListResponse(emails=emails, total=total, method=method))
         except Exception as e:
             errors.append(str(e))
 
     # ── Fallback: read from local DB ──
-    count_q = select(func.count()).where(Email.account_id == account_id)
-    total_result = await session.execute(count_q)
-    total = total_result.scalar() or 0
-
-    q = (
-        select(Email)
-        .where(Email.account_id == account_id)
-        .order_by(Email.received_at.desc())
-        .offset(skip)
-        .limit(top)
-    )
-    result = await session.execute(q)
-    db_emails = result.scalars().all()
-
-    emails = []
-    for e in db_emails:
-        emails.append(
-            EmailSummary(
-                id=e.message_id,
-                subject=e.subject,
-                sender=EmailAddress(name=e.sender_name or "", address=e.sender_address or ""),
-                received_at=e.received_at.isoformat() if e.received_at else None,
-                is_read=e.is_read,
-                preview=e.body_preview or "",
-            )
-        )
-
+    emails, total, next_cursor = await _local_email_page(session, account_id, top, skip, None)
     if total > 0:
-        return EmailListResponse(emails=emails, total=total, method="Local DB")
+        return _list_response(EmailListResponse(
+            emails=emails, total=total, method="Local DB", next_cursor=next_cursor
+        ))
 
     # All methods failed, return error details
     if errors:
@@ -170,24 +465,52 @@ async def list_emails(
             }
         )
 
-    return EmailListResponse(emails=emails, total=total, method="Local DB")
+    return _list_response(EmailListResponse(emails=emails, total=total, method="Local DB"))
 
 
 # ── Email detail: Graph API → local DB fallback ────────
 
+def _detail_etag(account_id: int, message_id: str, is_read: bool) -> str:
+    # The body never changes but the read state does, so it is part of the tag
+    digest = hashlib.md5(f"{account_id}:{message_id}:{int(bool(is_read))}".encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def _detail_cache_headers(etag: str) -> dict:
+    # no-cache: clients keep the body but revalidate each time, so a changed
+    # read state is never served from their cache
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+def _cached_detail_response(account_id: int, message_id: str, detail: EmailDetail) -> Response:
+    etag = _detail_etag(account_id, message_id, detail.is_read)
+    return _detail_response(detail, _detail_cache_headers(etag))
+
+
 @router.get("/accounts/{account_id}/emails/{message_id}", response_model=EmailDetail)
 async def get_email_detail(
     account_id: int,
     message_id: str,
+    request: Request,
     session: AsyncSession = Depends(get_session),
 ):
-    result = await session.execute(
-        select(Account).where(Account.id == account_id)
-    )
-    account = result.scalar_one_or_none()
+    account = await _get_account(session, account_id)
     if not account:
         raise HTTPException(404, "账号不存在")
 
+    # Message bodies don't change, so a client whose ETag matches the stored
+    # read state can skip Graph entirely
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        is_read = await session.scalar(select(Email.is_read).where(
+            Email.account_id == account_id,
+            Email.message_id == message_id,
+        ))
+        if is_read is not None:
+            etag = _detail_etag(account_id, message_id, is_read)
+            if if_none_match == etag:
+                return Response(status_code=304, headers=_detail_cache_headers(etag))
+
     proxy_url = await _get_proxy_url(account, session)
 
     # ── Try Graph API first (skip if previously marked as disabled) ──
@@ -197,24 +520,7 @@ async def get_email_detail(
             msg = await outlook_client.fetch_email_detail(
                 account.access_token, message_id, proxy_url=proxy_url
             )
-
-            to_list = []
-            for r in msg.get("toRecipients", []):
-                ea = r.get("emailAddress", {})
-                to_list.append(EmailAddress(name=ea.get("name"), address=ea.get("address", "")))
-
-            body = msg.get("body", {})
-
-            return EmailDetail(
-                id=msg["id"],
-                subject=msg.get("subject"),
-                sender=_parse_sender(msg),
-                to_recipients=to_list,
-                received_at=msg.get("receivedDateTime"),
-                is_read=msg.get("isRead", False),
-                body_html=body.get("content") if body.get("contentType") == "html" else f"<pre>{body.get('content', '')}</pre>",
-                has_attachments=msg.get("hasAttachments", False),
-            )
+            return _cached_detail_response(account_id, message_id, _to_detail(msg, _body_html(msg)))
         except ProxyError as e:
             raise HTTPException(502, f"代理连接错误: {e}")
         except Exception:
@@ -229,22 +535,7 @@ async def get_email_detail(
                 message_id=message_id,
             )
             if msg:
-                to_list = []
-                for r in msg.get("toRecipients", []):
-                    ea = r.get("emailAddress", {})
-                    to_list.append(EmailAddress(name=ea.get("name"), address=ea.get("address", "")))
-
-                body = msg.get("body", {})
-                return EmailDetail(
-                    id=msg["id"],
-                    subject=msg.get("subject"),
-                    sender=_parse_sender(msg),
-                    to_recipients=to_list,
-                    received_at=msg.get("receivedDateTime"),
-                    is_read=msg.get("isRead", False),
-                    body_html=body.get("content") if body.get("contentType") == "html" else f"<pre>{body.get('content', '')}</pre>",
-                    has_attachments=msg.get("hasAttachments", False),
-                )
+                return _cached_detail_response(account_id, message_id, _to_detail(msg, _body_html(msg)))
         except Exception:
             pass  # Fall through to local DB
 
@@ -259,19 +550,13 @@ async def get_email_detail(
     if not email_record:
         raise HTTPException(404, "邮件不存在")
 
-    return EmailDetail(
-        id=email_record.message_id,
-        subject=email_record.subject,
-        sender=EmailAddress(
-            name=email_record.sender_name or "",
-            address=email_record.sender_address or ""
-        ),
-        to_recipients=[],
-        received_at=email_record.received_at.isoformat() if email_record.received_at else None,
-        is_read=email_record.is_read,
-        body_html=email_record.body_html or f"<pre>{email_record.body_preview or '邮件内容需要通过 IMAP 获取完整正文'}</pre>",
-        has_attachments=False,
-    )
+    # Only tag a full body, not the preview placeholder
+    if email_record.body_html:
+        return _cached_detail_response(account_id, message_id, _local_detail(email_record, email_record.body_html))
+    return _detail_response(_local_detail(
+        email_record,
+        "<pre>" + html.escape(email_record.body_preview or "邮件内容需要通过 IMAP 获取完整正文", quote=False) + "</pre>",
+    ))
 
 
 # ── Delete emails ───────────────────────────────────────
@@ -283,10 +568,7 @@ async def delete_email(
     session: AsyncSession = Depends(get_session),
 ):
     """Delete an email via Graph API."""
-    result = await session.execute(
-        select(Account).where(Account.id == account_id)
-    )
-    account = result.scalar_one_or_none()
+    account = await session.get(Account, account_id)
     if not account:
         raise HTTPException(404, "账号不存在")
 
@@ -299,6 +581,7 @@ async def delete_email(
                 account.access_token, message_id, proxy_url=proxy_url
             )
             if ok:
+                _invalidate_pages(account_id)
                 return {"message": "邮件已删除"}
             raise HTTPException(400, "删除失败")
         except ProxyError as e:
@@ -322,10 +605,7 @@ async def batch_delete_emails(
     if not message_ids:
         raise HTTPException(400, "请选择要删除的邮件")
 
-    result = await session.execute(
-        select(Account).where(Account.id == account_id)
-    )
-    account = result.scalar_one_or_none()
+    account = await session.get(Account, account_id)
     if not account:
         raise HTTPException(404, "账号不存在")
 
@@ -336,20 +616,16 @@ async def batch_delete_emails(
 
     await _ensure_token(account, session, proxy_url=proxy_url)
 
-    success_count = 0
-    fail_count = 0
-    for mid in message_ids:
-        try:
-            ok = await outlook_client.delete_email(
-                account.access_token, mid, proxy_url=proxy_url
-            )
-            if ok:
-                success_count += 1
-            else:
-                fail_count += 1
-        except Exception:
-            fail_count += 1
+    try:
+        results = await outlook_client.batch_delete_emails(
+            account.access_token, message_ids, proxy_url=proxy_url
+        )
+    except ProxyError as e:
+        raise HTTPException(502, f"代理连接错误: {e}")
+    success_count = sum(results)
+    fail_count = len(results) - success_count
 
+    _invalidate_pages(account_id)
     return {
         "message": f"删除完成: 成功 {success_count}, 失败 {fail_count}",
         "success_count": success_count,
@@ -359,6 +635,18 @@ async def batch_delete_emails(
 
 # ── Local email search ──────────────────────────────────
 
+def _subject_filter(kw: str):
+    """Substring match on subject, via the trigram FTS index when possible."""
+    # Trigram MATCH needs at least 3 characters; shorter keywords use LIKE
+    if has_subject_fts() and len(kw) >= 3:
+        phrase = '"' + kw.replace('"', '""') + '"'
+        fts_ids = text(
+            "SELECT rowid FROM emails_fts WHERE emails_fts MATCH :fts_phrase"
+        ).bindparams(fts_phrase=phrase).columns(column("rowid", Integer))
+        return Email.id.in_(fts_ids)
+    return Email.subject.ilike(bindparam("kw_pattern", f"%{kw}%"))
+
+
 @router.get("/emails/search", response_model=SearchEmailResponse)
 async def search_emails(
     keyword: str = Query("", description="搜索主题关键词"),
@@ -366,58 +654,118 @@ async def search_emails(
     group_id: int = Query(None, description="按分组筛选"),
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="分页游标 (next_cursor)，优先于 page"),
     session: AsyncSession = Depends(get_session),
 ):
     """Search locally saved emails by subject keyword, optionally filtered by group."""
-    q = select(Email).join(Account, Email.account_id == Account.id)
+    kw = keyword.strip()
+    acct_kw = account_email.strip()
+    # An unfiltered search would page through the entire emails table
+    if not (kw or acct_kw or group_id is not None):
+        raise HTTPException(400, "请输入搜索关键词或选择分组")
 
+    filters = []
     if group_id is not None:
-        q = q.where(Account.group_id == group_id)
-
-    if keyword.strip():
-        q = q.where(Email.subject.ilike(f"%{keyword.strip()}%"))
-
-    if account_email.strip():
-        q = q.where(Account.email.ilike(f"%{account_email.strip()}%"))
-
-    # Count total
-    count_q = select(func.count()).select_from(q.subquery())
-    total_result = await session.execute(count_q)
-    total = total_result.scalar() or 0
-
-    # Fetch page – unread first, then by date
-    q = q.order_by(Email.is_read.asc(), Email.received_at.desc())
-    q = q.offset((page - 1) * page_size).limit(page_size)
-    result = await session.execute(q)
-    emails = result.scalars().all()
-
-    results = []
-    for e in emails:
-        results.append(LocalEmailSummary(
-            id=e.id,
-            account_id=e.account_id,
-            account_email=e.account.email if e.account else "",
-            message_id=e.message_id,
-            subject=e.subject,
-            sender_name=e.sender_name,
-            sender_address=e.sender_address,
-            received_at=e.received_at,
-            is_read=e.is_read,
-            body_preview=e.body_preview,
+        filters.append(Account.group_id == group_id)
+
+    if acct_kw:
+        filters.append(Account.email.ilike(bindparam("acct_pattern", f"%{acct_kw}%")))
+
+    # Only the account filters above need the accounts join for counting
+    needs_account_join = bool(filters)
+
+    if kw:
+        filters.append(_subject_filter(kw))
+
+    # Later pages of the same search reuse the first page's total
+    total_key = (kw, acct_kw, group_id)
+    cached_total = _search_total_cache.get(total_key)
+    now = time.monotonic()
+    total = None
+    if (cursor or page > 1) and cached_total and cached_total[0] > now:
+        total = cached_total[1]
+    counted = total is None
+
+    # Fetch page – unread first, then by date.
+    # Select just the summary columns plus Account.email from the existing join:
+    # no per-row account lookup, and body_html never leaves the DB.
+    columns = [
+        Email.id, Email.account_id, Account.email.label("account_email"),
+        Email.message_id, Email.subject, Email.sender_name, Email.sender_address,
+        Email.received_at, Email.is_read, Email.body_preview,
+    ]
+    # Offset pages carry the total on every row via a window count, saving the
+    # separate COUNT; after a cursor the window would only count the remainder.
+    windowed = total is None and not cursor
+    if windowed:
+        columns.append(func.count().over().label("full_count"))
+    q = (
+        select(*columns)
+        .join(Account, Email.account_id == Account.id)
+        .where(*filters)
+        .order_by(Email.is_read.asc(), Email.received_at.desc(), Email.id.desc())
+    )
+    if cursor:
+        is_read, received, email_id = _decode_cursor(cursor, 3)
+        # An int, not a bool: SQLAlchemy only allows =/!= against True/False
+        is_read = int(is_read == "1")
+        q = q.where(or_(
+            Email.is_read > is_read,
+            (Email.is_read == is_read) & _after_received(received, email_id),
         ))
+    else:
+        q = q.offset((page - 1) * page_size)
+    rows = (await session.execute(q.limit(page_size + 1))).all()
+
+    if windowed and (rows or page == 1):
+        total = rows[0].full_count if rows else 0
+    if total is None:
+        # Cursor page or page past the end: plain COUNT over the same filters
+        count_q = select(func.count(Email.id)).select_from(Email)
+        if needs_account_join:
+            count_q = count_q.join(Account, Email.account_id == Account.id)
+        count_q = count_q.where(*filters)
+        total = (await session.execute(count_q)).scalar() or 0
+    if counted:
+        for k in [k for k, (expires_at, _) in _search_total_cache.items() if expires_at <= now]:
+            del _search_total_cache[k]
+        _search_total_cache[total_key] = (now + SEARCH_TOTAL_TTL, total)
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = _encode_cursor(bool(last.is_read), last.received_at, last.id)
+
+    # Rows come straight from our own table, so skip per-field validation
+    results = [
+        LocalEmailSummary.model_construct(
+            id=r.id,
+            account_id=r.account_id,
+            account_email=r.account_email or "",
+            message_id=r.message_id,
+            subject=r.subject,
+            sender_name=r.sender_name,
+            sender_address=r.sender_address,
+            received_at=r.received_at,
+            is_read=bool(r.is_read),
+            body_preview=r.body_preview,
+        )
+        for r in rows
+    ]
 
-    return SearchEmailResponse(results=results, total=total)
+    return SearchEmailResponse(results=results, total=total, next_cursor=next_cursor)
 
 
 @router.patch("/emails/{email_id}/mark-read")
 async def mark_email_read(email_id: int, session: AsyncSession = Depends(get_session)):
     """Mark a locally saved email as read."""
-    result = await session.execute(select(Email).where(Email.id == email_id))
-    email = result.scalar_one_or_none()
-    if not email:
-        raise HTTPException(404, "邮件不存在")
-    email.is_read = True
+    result = await session.execute(
+        update(Email).where(Email.id == email_id).values(is_read=True)
+    )
     await session.commit()
+    if result.rowcount == 0:
+        raise HTTPException(404, "邮件不存在")
     return {"message": "ok"}
 
 
@@ -436,25 +784,10 @@ async def get_local_email_detail(
 
     # If body_html exists locally, return directly
     if email_record.body_html:
-        return EmailDetail(
-            id=email_record.message_id,
-            subject=email_record.subject,
-            sender=EmailAddress(
-                name=email_record.sender_name or "",
-                address=email_record.sender_address or ""
-            ),
-            to_recipients=[],
-            received_at=email_record.received_at.isoformat() if email_record.received_at else None,
-            is_read=email_record.is_read,
-            body_html=email_record.body_html,
-            has_attachments=False,
-        )
+        return _local_detail(email_record, email_record.body_html)
 
     # body_html is empty — try fetching from network and save locally
-    acct_result = await session.execute(
-        select(Account).where(Account.id == email_record.account_id)
-    )
-    account = acct_result.scalar_one_or_none()
+    account = await session.get(Account, email_record.account_id)
 
     if account:
         proxy_url = await _get_proxy_url(account, session)
@@ -467,29 +800,14 @@ async def get_local_email_detail(
                 msg = await outlook_client.fetch_email_detail(
                     account.access_token, email_record.message_id, proxy_url=proxy_url
                 )
-                body = msg.get("body", {})
-                fetched_body = body.get("content") if body.get("contentType") == "html" else f"<pre>{body.get('content', '')}</pre>"
-
-                to_list = []
-                for r in msg.get("toRecipients", []):
-                    ea = r.get("emailAddress", {})
-                    to_list.append(EmailAddress(name=ea.get("name"), address=ea.get("address", "")))
+                fetched_body = _body_html(msg)
 
                 # Save to local DB for future
                 if fetched_body:
                     email_record.body_html = fetched_body
                     await session.commit()
 
-                return EmailDetail(
-                    id=msg["id"],
-                    subject=msg.get("subject"),
-                    sender=_parse_sender(msg),
-                    to_recipients=to_list,
-                    received_at=msg.get("receivedDateTime"),
-                    is_read=msg.get("isRead", False),
-                    body_html=fetched_body or "",
-                    has_attachments=msg.get("hasAttachments", False),
-                )
+                return _to_detail(msg, fetched_body or "")
             except Exception:
                 pass
 
@@ -502,43 +820,18 @@ async def get_local_email_detail(
                     message_id=email_record.message_id,
                 )
                 if msg:
-                    body = msg.get("body", {})
-                    fetched_body = body.get("content") if body.get("contentType") == "html" else f"<pre>{body.get('content', '')}</pre>"
-
-                    to_list = []
-                    for r in msg.get("toRecipients", []):
-                        ea = r.get("emailAddress", {})
-                        to_list.append(EmailAddress(name=ea.get("name"), address=ea.get("address", "")))
+                    fetched_body = _body_html(msg)
 
                     # Save to local DB for future
                     if fetched_body:
                         email_record.body_html = fetched_body
                         await session.commit()
 
-                    return EmailDetail(
-                        id=msg["id"],
-                        subject=msg.get("subject"),
-                        sender=_parse_sender(msg),
-                        to_recipients=to_list,
-                        received_at=msg.get("receivedDateTime"),
-                        is_read=msg.get("isRead", False),
-                        body_html=fetched_body or "",
-                        has_attachments=msg.get("hasAttachments", False),
-                    )
+                    return _to_detail(msg, fetched_body or "")
             except Exception:
                 pass
 
     # All methods failed, return what we have
-    return EmailDetail(
-        id=email_record.message_id,
-        subject=email_record.subject,
-        sender=EmailAddress(
-            name=email_record.sender_name or "",
-            address=email_record.sender_address or ""
-        ),
-        to_recipients=[],
-        received_at=email_record.received_at.isoformat() if email_record.received_at else None,
-        is_read=email_record.is_read,
-        body_html=f"<pre>{email_record.body_preview or '该邮件未保存完整正文'}</pre>",
-        has_attachments=False,
+    return _local_detail(
+        email_record, "<pre>" + html.escape(email_record.body_preview or "该邮件未保存完整正文", quote=False) + "</pre>"
     )
@@ -1,13 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import delete, exists, select, func, update
+from sqlalchemy.orm import noload
 from typing import List
-import httpx
 import time
 
 from scheduler import reload_group_job
+from routes.emails import invalidate_account_cache, invalidate_proxy_cache
 
 from database import get_session
+from outlook_client import outlook_client
 from models import Group, Account
 from schemas import GroupCreate, GroupUpdate, GroupResponse
 
@@ -40,25 +42,23 @@ async def _account_count(session, group_id):
 
 @router.get("", response_model=List[GroupResponse])
 async def list_groups(session: AsyncSession = Depends(get_session)):
+    # Groups and their account counts in one query instead of one COUNT per group.
+    # noload: the counts are all this needs, not every group's account rows.
     result = await session.execute(
-        select(Group).order_by(Group.created_at.desc())
+        select(Group, func.count(Account.id))
+        .options(noload(Group.accounts))
+        .outerjoin(Account, Account.group_id == Group.id)
+        .group_by(Group.id)
+        .order_by(Group.created_at.desc())
     )
-    groups = result.scalars().all()
-    out = []
-    for g in groups:
-        count = await _account_count(session, g.id)
-        out.append(_build_response(g, count))
-    return out
+    return [_build_response(g, count) for g, count in result.all()]
 
 
 @router.post("", response_model=GroupResponse)
 async def create_group(
     payload: GroupCreate, session: AsyncSession = Depends(get_session)
 ):
-    existing = await session.execute(
-        select(Group).where(Group.name == payload.name)
-    )
-    if existing.scalar_one_or_none():
+    if await session.scalar(select(exists().where(Group.name == payload.name))):
         raise HTTPException(400, f"分组 '{payload.name}' 已存在")
 
     group = Group(
@@ -74,7 +74,6 @@ async def create_group(
     )
     session.add(group)
     await session.commit()
-    await session.refresh(group)
 
     # Reload scheduler jobs if auto_sync is enabled
     if group.auto_sync:
@@ -97,10 +96,9 @@ async def update_group(
         raise HTTPException(404, "分组不存在")
 
     if payload.name is not None:
-        dup = await session.execute(
-            select(Group).where(Group.name == payload.name, Group.id != group_id)
-        )
-        if dup.scalar_one_or_none():
+        if await session.scalar(
+            select(exists().where(Group.name == payload.name, Group.id != group_id))
+        ):
             raise HTTPException(400, f"分组名 '{payload.name}' 已被使用")
         group.name = payload.name
     if payload.description is not None:
@@ -122,7 +120,7 @@ async def update_group(
         group.refresh_interval_hours = payload.refresh_interval_hours
 
     await session.commit()
-    await session.refresh(group)
+    invalidate_proxy_cache(group.id)
 
     # Reload scheduler jobs whenever sync-related settings change
     await reload_group_job(group.id)
@@ -135,21 +133,20 @@ async def update_group(
 async def delete_group(
     group_id: int, session: AsyncSession = Depends(get_session)
 ):
-    result = await session.execute(
-        select(Group).where(Group.id == group_id)
-    )
-    group = result.scalar_one_or_none()
-    if not group:
+    # Two bulk statements: ungroup the accounts, then drop the group.
+    # Going through the ORM would load every account and UPDATE them one by one.
+    ungrouped = (await session.execute(
+        update(Account).where(Account.group_id == group_id).values(group_id=None)
+        .returning(Account.id)
+    )).scalars().all()
+    result = await session.execute(delete(Group).where(Group.id == group_id))
+    if result.rowcount == 0:
+        await session.rollback()
         raise HTTPException(404, "分组不存在")
-
-    acct_result = await session.execute(
-        select(Account).where(Account.group_id == group_id)
-    )
-    for acct in acct_result.scalars().all():
-        acct.group_id = None
-
-    await session.delete(group)
     await session.commit()
+    invalidate_proxy_cache(group_id)
+    for account_id in ungrouped:
+        invalidate_account_cache(account_id)
 
     # Remove scheduler jobs for deleted group
     await reload_group_job(group_id)
@@ -173,17 +170,15 @@ async def test_proxy(
 
     start = time.time()
     try:
-        async with httpx.AsyncClient(
-            timeout=10.0, proxy=group.proxy_url
-        ) as client:
-            resp = await client.get("https://graph.microsoft.com/v1.0/$metadata")
-            latency = round((time.time() - start) * 1000)
-            return {
-                "ok": True,
-                "status_code": resp.status_code,
-                "latency_ms": latency,
-                "message": f"代理连接成功 ({latency}ms)",
-            }
+        # Pooled per-proxy client: repeat tests reuse the kept-alive connection
+        status_code = await outlook_client.probe_graph(group.proxy_url)
+        latency = round((time.time() - start) * 1000)
+        return {
+            "ok": True,
+            "status_code": status_code,
+            "latency_ms": latency,
+            "message": f"代理连接成功 ({latency}ms)",
+        }
     except Exception as e:
         latency = round((time.time() - start) * 1000)
         return {
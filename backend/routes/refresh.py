@@ -1,147 +1,291 @@
 import logging
-import json
 import asyncio
+import anyio
 from datetime import datetime, timedelta
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, delete
+from sqlalchemy import select, func
+from sqlalchemy.orm import selectinload
 
 from database import get_session, async_session
 from models import Account, RefreshLog, Group, Setting
 from schemas import RefreshLogResponse, RefreshStatsResponse
 from outlook_client import outlook_client
-from config import DEFAULT_CLIENT_ID
+import token_cache
+from config import REFRESH_LOG_RETENTION_DAYS
+from routes.emails import invalidate_account_cache
+from sse import SSE_PING, SSE_PING_SECONDS, sse_event, sse_response
 
 logger = logging.getLogger("refresh")
 
 router = APIRouter(prefix="/api/accounts", tags=["refresh"])
 
 
-async def _do_refresh_one(account, session, refresh_type="manual"):
-    """Refresh token for a single account, returns (success, error_message)."""
-    client_id = account.client_id or DEFAULT_CLIENT_ID
-    if not client_id or not account.refresh_token:
-        return False, "缺少 client_id 或 refresh_token"
+async def fetch_token(account, proxy_url=None):
+    """Network half of a refresh. Returns (token_data, error_message)."""
+    if not account.client_id or not account.refresh_token:
+        return None, "缺少 client_id 或 refresh_token"
+    try:
+        # Same per-account lock as the email routes and the scheduler, so a manual
+        # refresh never races another refresh of this account's token
+        async with token_cache.refresh_lock(account.id):
+            # Another path may have rotated the token while we waited; the
+            # refresh_token loaded with this account would be stale by now
+            cached = token_cache.get(account.id)
+            if cached and cached[1] != account.refresh_token:
+                access_token, refresh_token, expires_at = cached
+                return {
+                    "access_token": access_token,
+                    "refresh_token": refresh_token,
+                    "expires_in": int((expires_at - datetime.utcnow()).total_seconds()),
+                }, None
+            token_data = await outlook_client.refresh_access_token(
+                account.client_id, account.refresh_token, proxy_url=proxy_url
+            )
+        return token_data, None
+    except Exception as e:
+        return None, str(e)
 
-    # Get proxy_url from group if available
-    proxy_url = None
-    if account.group_id:
-        grp_result = await session.execute(
-            select(Group).where(Group.id == account.group_id)
-        )
-        grp = grp_result.scalar_one_or_none()
-        if grp and grp.proxy_url:
-            proxy_url = grp.proxy_url
 
-    try:
-        token_data = await outlook_client.refresh_access_token(
-            client_id, account.refresh_token, proxy_url=proxy_url
-        )
-        account.access_token = token_data["access_token"]
-        if "refresh_token" in token_data:
-            account.refresh_token = token_data["refresh_token"]
-        account.token_expires_at = datetime.utcnow() + timedelta(
-            seconds=token_data.get("expires_in", 3600)
-        )
+# Manual refreshes skip accounts whose access token is valid for at least this long
+FRESH_TOKEN_MINUTES = 10
+
+# Stands in for token_data when a manual refresh skipped a still-fresh token
+_FRESH = object()
+
+
+def _token_fresh(account) -> bool:
+    return (
+        account.refresh_status == "success"
+        and account.token_expires_at is not None
+        and account.token_expires_at - datetime.utcnow() > timedelta(minutes=FRESH_TOKEN_MINUTES)
+    )
+
+
+def _proxy_url(account):
+    return account.group.proxy_url if account.group and account.group.proxy_url else None
+
+
+# Load each account's group in one IN query, without the group → accounts cascade
+WITH_GROUP = selectinload(Account.group).noload(Group.accounts)
+
+
+def publish_tokens(accounts) -> None:
+    """Hand committed tokens to the email routes. Call only after the commit,
+    so no reader picks up a token the DB might still roll back."""
+    for account in accounts:
+        token_cache.put_account(account)
+        invalidate_account_cache(account.id)
+
+
+def apply_token(account, token_data) -> None:
+    """Set a token response from fetch_token on the account (not committed)."""
+    account.access_token = token_data["access_token"]
+    if "refresh_token" in token_data:
+        account.refresh_token = token_data["refresh_token"]
+    account.token_expires_at = datetime.utcnow() + timedelta(
+        seconds=token_data.get("expires_in", 3600)
+    )
+
+
+def _record_refresh(account, session, refresh_type, token_data, error_msg):
+    """DB half of a refresh: apply the result and add a RefreshLog (not committed).
+    Returns (success, error_message); publish successes with publish_tokens once committed.
+    """
+    if token_data is None and not (account.client_id and account.refresh_token):
+        # Nothing was attempted, so nothing is logged
+        return False, error_msg
+
+    if token_data is not None:
+        apply_token(account, token_data)
         account.last_refresh_at = datetime.utcnow()
         account.refresh_status = "success"
         account.status = "active"
         account.last_error = None
-
-        # Log success
-        log = RefreshLog(
-            account_id=account.id,
-            account_email=account.email,
-            refresh_type=refresh_type,
-            status="success",
-        )
-        session.add(log)
-        await session.commit()
-        return True, None
-    except Exception as e:
-        error_msg = str(e)
+    else:
         account.refresh_status = "failed"
         account.last_error = error_msg
 
-        # Log failure
-        log = RefreshLog(
-            account_id=account.id,
-            account_email=account.email,
-            refresh_type=refresh_type,
-            status="failed",
-            error_message=error_msg,
-        )
-        session.add(log)
+    session.add(RefreshLog(
+        account_id=account.id,
+        account_email=account.email,
+        refresh_type=refresh_type,
+        status="success" if token_data is not None else "failed",
+        error_message=error_msg,
+    ))
+    return token_data is not None, error_msg
+
+
+async def _do_refresh_one(account, session, refresh_type="manual", commit=True, force=False):
+    """Refresh token for a single account, returns (success, error_message).
+    Expects account.group to be loaded (Account.group is selectin-loaded with the account).
+    With commit=False the caller commits, so bulk refreshes can batch their writes.
+    Manual refreshes of a still-fresh token are skipped unless force=True.
+    """
+    if not force and refresh_type == "manual" and _token_fresh(account):
+        return True, None
+    token_data, error_msg = await fetch_token(account, _proxy_url(account))
+    ok, error_msg = _record_refresh(account, session, refresh_type, token_data, error_msg)
+    if commit:
         await session.commit()
-        return False, error_msg
+        if ok:
+            publish_tokens([account])
+    return ok, error_msg
+
+
+# Max token refreshes in flight during refresh-all
+REFRESH_CONCURRENCY = 10
+
+# Bulk refreshes commit account updates + RefreshLog rows every this many accounts
+REFRESH_COMMIT_BATCH = 20
+
+
+async def refresh_many(accounts, session, refresh_type):
+    """Refresh a list of accounts (with account.group loaded); returns (success, failed).
+
+    Token requests run concurrently, up to REFRESH_CONCURRENCY at a time; results
+    are recorded on ``session`` as they arrive and committed every REFRESH_COMMIT_BATCH.
+    """
+    sem = asyncio.Semaphore(REFRESH_CONCURRENCY)
+
+    async def _fetch(account):
+        async with sem:
+            return account, *await fetch_token(account, _proxy_url(account))
+
+    success_count = 0
+    fail_count = 0
+    refreshed = []  # Published after the batch that holds them commits
+    for i, fut in enumerate(asyncio.as_completed([_fetch(a) for a in accounts]), 1):
+        account, token_data, err = await fut
+        ok, _ = _record_refresh(account, session, refresh_type, token_data, err)
+        if ok:
+            success_count += 1
+            refreshed.append(account)
+        else:
+            fail_count += 1
+        if i % REFRESH_COMMIT_BATCH == 0:
+            await session.commit()
+            publish_tokens(refreshed)
+            refreshed.clear()
+    await session.commit()
+    publish_tokens(refreshed)
+    return success_count, fail_count
 
 
 @router.get("/refresh-all")
 async def refresh_all():
-    """SSE stream: refresh all accounts one by one."""
+    """SSE stream: refresh all accounts, reporting each as it finishes."""
     async def event_generator():
         async with async_session() as session:
             result = await session.execute(
-                select(Account).where(Account.refresh_token.isnot(None))
+                select(Account).options(WITH_GROUP).where(Account.refresh_token.isnot(None))
             )
             accounts = list(result.scalars().all())
             total = len(accounts)
             success_count = 0
             fail_count = 0
 
-            yield f"data: {json.dumps({'type': 'start', 'total': total})}\n\n"
-
-            for i, account in enumerate(accounts):
-                ok, err = await _do_refresh_one(account, session, refresh_type="manual")
+            yield sse_event({"type": "start", "total": total})
+
+            # Token requests run concurrently; only this generator touches the session
+            sem = asyncio.Semaphore(REFRESH_CONCURRENCY)
+
+            # Tasks past the semaphore, whose token request may already have
+            # rotated the refresh token at Microsoft
+            started = set()
+
+            async def _fetch(account):
+                if _token_fresh(account):
+                    return account, _FRESH, None
+                async with sem:
+                    started.add(asyncio.current_task())
+                    return account, *await fetch_token(account, _proxy_url(account))
+
+            tasks = [asyncio.create_task(_fetch(a)) for a in accounts]
+            pending = set(tasks)
+            unrecorded = set(tasks)
+            current = 0
+            refreshed = []  # Published after the batch that holds them commits
+
+            def _record(task):
+                unrecorded.discard(task)
+                account, token_data, err = task.result()
+                if token_data is _FRESH:
+                    # Still valid: nothing to refresh, nothing to log
+                    return account, True, None
+                ok, err = _record_refresh(account, session, "manual", token_data, err)
                 if ok:
-                    success_count += 1
-                else:
-                    fail_count += 1
-
-                yield f"data: {json.dumps({'type': 'progress', 'current': i + 1, 'total': total, 'email': account.email, 'success': ok, 'error': err, 'success_count': success_count, 'fail_count': fail_count}, ensure_ascii=False)}\n\n"
-
-                await asyncio.sleep(0.1)  # Small delay between accounts
-
-            yield f"data: {json.dumps({'type': 'done', 'total': total, 'success_count': success_count, 'fail_count': fail_count})}\n\n"
-
-    return StreamingResponse(
-        event_generator(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",
-        },
-    )
+                    refreshed.append(account)
+                return account, ok, err
+
+            # Reused for every progress frame; only the changing fields are set
+            progress = {"type": "progress", "total": total}
+            try:
+                while pending:
+                    # Each yield waits for the client to take the frame, so a slow
+                    # reader holds back the DB writes instead of piling up frames.
+                    done, pending = await asyncio.wait(
+                        pending, timeout=SSE_PING_SECONDS, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    if not done:
+                        yield SSE_PING
+                        continue
+                    for task in done:
+                        account, ok, err = _record(task)
+                        current += 1
+                        if current % REFRESH_COMMIT_BATCH == 0:
+                            await session.commit()
+                            publish_tokens(refreshed)
+                            refreshed.clear()
+                        if ok:
+                            success_count += 1
+                        else:
+                            fail_count += 1
+
+                        progress.update(
+                            current=current, email=account.email, success=ok, error=err,
+                            success_count=success_count, fail_count=fail_count,
+                        )
+                        yield sse_event(progress)
+            finally:
+                # On a disconnect this runs inside Starlette's cancelled scope;
+                # unshielded, the commit would be cancelled too and the rotated
+                # refresh tokens lost (Microsoft has already retired the old ones)
+                with anyio.CancelScope(shield=True):
+                    # Client went away mid-stream: drop the refreshes still queued,
+                    # let the in-flight ones finish and keep every token obtained
+                    for t in unrecorded - started:
+                        t.cancel()
+                    await asyncio.gather(*unrecorded, return_exceptions=True)
+                    for t in list(unrecorded):
+                        if not t.cancelled() and t.exception() is None:
+                            _record(t)
+                    await session.commit()
+                    publish_tokens(refreshed)
+
+            yield sse_event({"type": "done", "total": total,
+                        "success_count": success_count, "fail_count": fail_count})
+
+    return sse_response(event_generator())
 
 
 @router.get("/refresh-stats", response_model=RefreshStatsResponse)
 async def refresh_stats(session: AsyncSession = Depends(get_session)):
     """Get refresh statistics."""
-    total = (await session.execute(
-        select(func.count(Account.id)).where(Account.refresh_token.isnot(None))
-    )).scalar() or 0
-
-    success = (await session.execute(
-        select(func.count(Account.id)).where(
-            Account.refresh_token.isnot(None),
-            Account.refresh_status == "success",
-        )
-    )).scalar() or 0
-
-    failed = (await session.execute(
-        select(func.count(Account.id)).where(
-            Account.refresh_token.isnot(None),
-            Account.refresh_status == "failed",
-        )
-    )).scalar() or 0
+    # One pass over accounts with conditional counts instead of three COUNT queries
+    row = (await session.execute(
+        select(
+            func.count(Account.id).label("total"),
+            func.count(Account.id).filter(Account.refresh_status == "success").label("success"),
+            func.count(Account.id).filter(Account.refresh_status == "failed").label("failed"),
+        ).where(Account.refresh_token.isnot(None))
+    )).one()
 
     return RefreshStatsResponse(
-        total=total,
-        success=success,
-        failed=failed,
-        unknown=total - success - failed,
+        total=row.total,
+        success=row.success,
+        failed=row.failed,
+        unknown=row.total - row.success - row.failed,
     )
 
 
@@ -152,13 +296,8 @@ async def get_refresh_logs(
     session: AsyncSession = Depends(get_session),
 ):
     """Get refresh history (last 6 months)."""
-    six_months_ago = datetime.utcnow() - timedelta(days=180)
-
-    # Clean up old records
-    await session.execute(
-        delete(RefreshLog).where(RefreshLog.created_at < six_months_ago)
-    )
-    await session.commit()
+    # Older rows are deleted by the scheduler's daily purge; hide any not yet purged
+    six_months_ago = datetime.utcnow() - timedelta(days=REFRESH_LOG_RETENTION_DAYS)
 
     # Count total
     total = (await session.execute(
@@ -167,18 +306,22 @@ async def get_refresh_logs(
         )
     )).scalar() or 0
 
-    # Fetch page
+    # Fetch page as plain columns: loading RefreshLog entities would also
+    # selectin-load each row's full Account (tokens included)
     result = await session.execute(
-        select(RefreshLog)
+        select(
+            RefreshLog.id, RefreshLog.account_id, RefreshLog.account_email,
+            RefreshLog.refresh_type, RefreshLog.status, RefreshLog.error_message,
+            RefreshLog.created_at,
+        )
         .where(RefreshLog.created_at >= six_months_ago)
         .order_by(RefreshLog.created_at.desc())
         .offset((page - 1) * page_size)
         .limit(page_size)
     )
-    logs = result.scalars().all()
 
     return {
-        "logs": [RefreshLogResponse.model_validate(log) for log in logs],
+        "logs": [RefreshLogResponse.model_construct(**row._mapping) for row in result.all()],
         "total": total,
         "page": page,
         "page_size": page_size,
@@ -188,13 +331,16 @@ async def get_refresh_logs(
 @router.get("/refresh-logs/failed")
 async def get_failed_accounts(session: AsyncSession = Depends(get_session)):
     """Get accounts that are currently in failed refresh status."""
+    # Only the columns shown, so tokens and passwords never leave the DB here
     result = await session.execute(
-        select(Account).where(
+        select(
+            Account.id, Account.email, Account.remark, Account.last_error,
+            Account.last_refresh_at, Account.group_id,
+        ).where(
             Account.refresh_token.isnot(None),
             Account.refresh_status == "failed",
         )
     )
-    accounts = result.scalars().all()
     return [
         {
             "id": a.id,
@@ -204,7 +350,7 @@ async def get_failed_accounts(session: AsyncSession = Depends(get_session)):
             "last_refresh_at": a.last_refresh_at.isoformat() if a.last_refresh_at else None,
             "group_id": a.group_id,
         }
-        for a in accounts
+        for a in result.all()
     ]
 
 
@@ -214,14 +360,11 @@ async def retry_refresh_one(
     session: AsyncSession = Depends(get_session),
 ):
     """Retry refresh for a single account."""
-    result = await session.execute(
-        select(Account).where(Account.id == account_id)
-    )
-    account = result.scalar_one_or_none()
+    account = await session.get(Account, account_id, options=[WITH_GROUP])
     if not account:
         raise HTTPException(404, "账号不存在")
 
-    ok, err = await _do_refresh_one(account, session, refresh_type="retry")
+    ok, err = await _do_refresh_one(account, session, refresh_type="retry", force=True)
     if ok:
         return {"message": "刷新成功", "success": True}
     else:
@@ -232,21 +375,12 @@ async def retry_refresh_one(
 async def retry_all_failed(session: AsyncSession = Depends(get_session)):
     """Retry refresh for all failed accounts."""
     result = await session.execute(
-        select(Account).where(
+        select(Account).options(WITH_GROUP).where(
             Account.refresh_token.isnot(None),
             Account.refresh_status == "failed",
         )
     )
-    accounts = result.scalars().all()
-    success_count = 0
-    fail_count = 0
-
-    for account in accounts:
-        ok, _ = await _do_refresh_one(account, session, refresh_type="retry")
-        if ok:
-            success_count += 1
-        else:
-            fail_count += 1
+    success_count, fail_count = await refresh_many(result.scalars().all(), session, "retry")
 
     return {
         "message": f"重试完成: 成功 {success_count}, 失败 {fail_count}",
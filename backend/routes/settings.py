@@ -1,8 +1,11 @@
 import logging
+import time
 from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from typing import Dict, Optional, Tuple
 
 from database import get_session
 from models import Setting
@@ -12,13 +15,43 @@ logger = logging.getLogger("settings")
 
 router = APIRouter(prefix="/api/settings", tags=["settings"])
 
+# All settings as {key: value}: (expires_at, values), reloaded at most every TTL seconds
+SETTINGS_CACHE_TTL = 60
+_settings_cache: Tuple[float, Dict[str, Optional[str]]] = (0.0, {})
+
+
+async def load_settings(session: AsyncSession) -> Dict[str, Optional[str]]:
+    """Return every setting, from the cache when fresh. Callers must not mutate the dict."""
+    global _settings_cache
+    if _settings_cache[0] > time.monotonic():
+        return _settings_cache[1]
+    result = await session.execute(select(Setting.key, Setting.value))
+    values = dict(result.all())
+    _settings_cache = (time.monotonic() + SETTINGS_CACHE_TTL, values)
+    return values
+
+
+def invalidate_settings_cache():
+    global _settings_cache
+    _settings_cache = (0.0, {})
+
+
+async def _upsert_settings(session: AsyncSession, values: Dict[str, Optional[str]]):
+    """Insert or overwrite settings in one INSERT ... ON CONFLICT DO UPDATE (not committed)."""
+    now = datetime.utcnow()
+    stmt = sqlite_insert(Setting).values(
+        [{"key": k, "value": v, "updated_at": now} for k, v in values.items()]
+    )
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=["key"],
+        set_={"value": stmt.excluded.value, "updated_at": stmt.excluded.updated_at},
+    ))
+
 
 @router.get("")
 async def get_settings(session: AsyncSession = Depends(get_session)):
     """Get all settings as a dict."""
-    result = await session.execute(select(Setting))
-    settings = result.scalars().all()
-    return {s.key: s.value for s in settings}
+    return dict(await load_settings(session))
 
 
 @router.put("")
@@ -26,18 +59,12 @@ async def update_settings(
     payload: SettingsUpdate, session: AsyncSession = Depends(get_session)
 ):
     """Batch update settings."""
-    for item in payload.settings:
-        result = await session.execute(
-            select(Setting).where(Setting.key == item.key)
-        )
-        setting = result.scalar_one_or_none()
-        if setting:
-            setting.value = item.value
-            setting.updated_at = datetime.utcnow()
-        else:
-            setting = Setting(key=item.key, value=item.value)
-            session.add(setting)
-    await session.commit()
+    # Later entries for the same key win, as with sequential updates
+    values = {item.key: item.value for item in payload.settings}
+    if values:
+        await _upsert_settings(session, values)
+        await session.commit()
+    invalidate_settings_cache()
     return {"message": "设置已更新"}
 
 
@@ -51,12 +78,9 @@ async def change_password(
     # Verify old password
     if payload.old_password != AUTH_PASSWORD:
         # Also check if password was stored in settings
-        result = await session.execute(
-            select(Setting).where(Setting.key == "auth_password")
-        )
-        setting = result.scalar_one_or_none()
-        if setting:
-            if payload.old_password != setting.value:
+        settings = await load_settings(session)
+        if "auth_password" in settings:
+            if payload.old_password != settings["auth_password"]:
                 raise HTTPException(400, "旧密码不正确")
         else:
             raise HTTPException(400, "旧密码不正确")
@@ -65,17 +89,9 @@ async def change_password(
         raise HTTPException(400, "新密码至少需要4位")
 
     # Save new password to settings
-    result = await session.execute(
-        select(Setting).where(Setting.key == "auth_password")
-    )
-    setting = result.scalar_one_or_none()
-    if setting:
-        setting.value = payload.new_password
-        setting.updated_at = datetime.utcnow()
-    else:
-        setting = Setting(key="auth_password", value=payload.new_password)
-        session.add(setting)
+    await _upsert_settings(session, {"auth_password": payload.new_password})
     await session.commit()
+    invalidate_settings_cache()
 
     logger.info("Password changed successfully")
     return {"message": "密码已修改"}
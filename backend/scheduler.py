@@ -1,65 +1,185 @@
 import asyncio
 import logging
+import time
 from datetime import datetime, timedelta
-from collections import deque
-from dateutil import parser as dtparser
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass, field
+import orjson
+from apscheduler.events import EVENT_JOB_ADDED, EVENT_JOB_MODIFIED, EVENT_JOB_REMOVED
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy import and_, bindparam, delete, func, or_, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import noload
 
 from database import async_session
-from models import Account, Group, Email
+from models import Account, Group, Email, RefreshLog
 from outlook_client import outlook_client
+from config import REDIS_URL, REFRESH_LOG_RETENTION_DAYS
+from routes.refresh import WITH_GROUP, publish_tokens, refresh_many
+import token_cache
 
-from typing import Dict, List
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 logger = logging.getLogger("scheduler")
 
-# Store new-email events: {account_id: new_unread_count}
-new_email_events: Dict[int, int] = {}
+# Store new-email events: {account_id: new_unread_count}, summed until /api/notifications drains them
+new_email_events: Counter = Counter()
 
-# Track per-group round-robin state: {group_id: offset}
-_group_offsets: Dict[int, int] = {}
 
-# Sync log: store recent sync entries (max 200)
+@dataclass
+class SchedulerState:
+    """Per-group round-robin offsets, advanced under a per-group lock.
+
+    The interval jobs and the manual sync-all endpoint can run the same group
+    concurrently; claiming a slice under the lock keeps them from syncing the
+    same accounts twice or skipping any.
+    """
+    group_offsets: Dict[int, int] = field(default_factory=dict)
+    locks: Dict[int, asyncio.Lock] = field(default_factory=lambda: defaultdict(asyncio.Lock))
+
+    async def claim(self, group_id: int, total: int, batch_size: int) -> Tuple[int, int]:
+        """Reserve the next batch; returns (start_offset, count) and advances past it."""
+        async with self.locks[group_id]:
+            offset = self.group_offsets.get(group_id, 0) % total
+            count = min(batch_size, total)
+            self.group_offsets[group_id] = (offset + count) % total
+            return offset, count
+
+
+sync_state = SchedulerState()
+
+# Accounts of one group batch synced at once (the work is Graph/IMAP round trips)
+SYNC_CONCURRENCY = 5
+
+# Sync log: recent entries (max 200) as (epoch, level, email, message) tuples,
+# turned into dicts (and ISO times) only when read, streamed or mirrored to Redis
 MAX_LOG_ENTRIES = 200
 sync_log: deque = deque(maxlen=MAX_LOG_ENTRIES)
 
+# With REDIS_URL set, entries are also kept in a Redis list (shared across workers,
+# kept across restarts) and published for live subscribers
+SYNC_LOG_KEY = "sync_log"
+SYNC_LOG_CHANNEL = "sync_log:stream"
+_redis = None
+_redis_writes: set = set()
+
+# Live sync-log subscribers, one bounded queue each; a reader that falls this
+# far behind is disconnected instead of buffering without limit
+SYNC_LOG_SUBSCRIBER_BUFFER = 64
+_log_subscribers: set = set()
+_LOG_CLOSED = object()
+
+# Dashboard polls share these snapshots: (expires_at, value)
+STATUS_CACHE_TTL = 1.0
+SYNC_LOG_CACHE_TTL = 0.25
+_status_cache: Optional[Tuple[float, dict]] = None
+_log_cache: Optional[Tuple[float, list]] = None
+
 scheduler = AsyncIOScheduler()
 
 
-def _add_log(level: str, email: str, message: str):
-    """Add an entry to the sync log."""
-    sync_log.appendleft({
-        "time": datetime.utcnow().isoformat() + "Z",
+def _init_redis():
+    """Connect the optional Redis sync log; stays in-memory if unset or unavailable."""
+    global _redis
+    if not REDIS_URL:
+        return
+    try:
+        import redis.asyncio as aioredis
+    except ImportError:
+        logger.warning("已设置 REDIS_URL 但未安装 redis，同步日志仅保存在内存中")
+        return
+    _redis = aioredis.from_url(REDIS_URL)
+
+
+async def _push_log_redis(payload: bytes):
+    try:
+        async with _redis.pipeline(transaction=False) as pipe:
+            pipe.lpush(SYNC_LOG_KEY, payload)
+            pipe.ltrim(SYNC_LOG_KEY, 0, MAX_LOG_ENTRIES - 1)
+            pipe.publish(SYNC_LOG_CHANNEL, payload)
+            await pipe.execute()
+    except Exception as e:
+        logger.debug(f"写入 Redis 同步日志失败: {e}")
+
+
+def _log_entry(record: tuple) -> dict:
+    ts, level, email, message = record
+    return {
+        "time": datetime.utcfromtimestamp(ts).isoformat() + "Z",
         "level": level,
         "email": email,
         "message": message,
-    })
+    }
+
+
+def _add_log(level: str, email: str, message: str):
+    """Add an entry to the sync log."""
+    global _log_cache
+    record = (time.time(), level, email, message)
+    sync_log.appendleft(record)
+    _log_cache = None
+    if not _log_subscribers and _redis is None:
+        return
+    entry = _log_entry(record)
+    for q in list(_log_subscribers):
+        try:
+            q.put_nowait(entry)
+        except asyncio.QueueFull:
+            _log_subscribers.discard(q)
+            while not q.empty():
+                q.get_nowait()
+            q.put_nowait(_LOG_CLOSED)
+    if _redis is not None:
+        try:
+            task = asyncio.get_running_loop().create_task(_push_log_redis(orjson.dumps(entry)))
+        except RuntimeError:
+            return
+        # Hold a reference until the write finishes so the task isn't collected
+        _redis_writes.add(task)
+        task.add_done_callback(_redis_writes.discard)
+
+
+# Sync refreshes a token once it is this close to expiring
+TOKEN_EARLY_REFRESH = timedelta(minutes=5)
 
 
 async def _maybe_refresh_token(account: Account, proxy_url: str = None):
     """Refresh token only if expired or expiring within 5 minutes.
     Returns True if token was refreshed (or still valid), False on error.
+    A new token is only set on ``account``; the caller commits, then publish_tokens.
     """
     now = datetime.utcnow()
+    valid_until = now + TOKEN_EARLY_REFRESH
     # If token_expires_at is set and not expiring within 5 min, skip refresh
-    if account.token_expires_at and account.token_expires_at > now + timedelta(minutes=5):
+    if account.token_expires_at and account.token_expires_at > valid_until:
         return True
 
-    # Token expired or about to expire — refresh
-    try:
-        token_data = await outlook_client.refresh_access_token(
-            account.client_id, account.refresh_token, proxy_url=proxy_url
-        )
-        account.access_token = token_data["access_token"]
-        account.refresh_token = token_data["refresh_token"]
-        account.token_expires_at = now + timedelta(seconds=token_data["expires_in"])
-        logger.info(f"🔑 Token 已刷新: {account.email}")
-        return True
-    except Exception as e:
-        logger.warning(f"🔑 Token 刷新失败 {account.email}: {e}")
-        return False
+    # Token expired or about to expire — refresh, unless a web request just did
+    async with token_cache.refresh_lock(account.id):
+        cached = token_cache.get(account.id)
+        if cached and cached[2] > valid_until:
+            account.access_token, account.refresh_token, account.token_expires_at = cached
+            return True
+        try:
+            token_data = await outlook_client.refresh_access_token(
+                account.client_id, account.refresh_token, proxy_url=proxy_url
+            )
+            account.access_token = token_data["access_token"]
+            account.refresh_token = token_data["refresh_token"]
+            account.token_expires_at = now + timedelta(seconds=token_data["expires_in"])
+            logger.info(f"🔑 Token 已刷新: {account.email}")
+            return True
+        except Exception as e:
+            logger.warning(f"🔑 Token 刷新失败 {account.email}: {e}")
+            return False
+
+
+# Built once and reused for every save; the expanding IN keeps one compiled
+# form whatever the batch size
+_EXISTING_IDS = select(Email.message_id).where(
+    Email.account_id == bindparam("acc_id"),
+    Email.message_id.in_(bindparam("ids", expanding=True)),
+)
 
 
 async def _save_emails_from_list(session, account: Account, messages: list):
@@ -67,15 +187,17 @@ async def _save_emails_from_list(session, account: Account, messages: list):
     Messages use the same Graph-API-like format from outlook_client.
     """
     try:
-        if not messages:
+        # Probe only this batch's ids, so stored messages (and their bodies) aren't
+        # re-sent just to be dropped by the conflict clause
+        candidate_ids = [m["id"] for m in messages if m.get("id")]
+        if not candidate_ids:
             return 0
-
         existing_result = await session.execute(
-            select(Email.message_id).where(Email.account_id == account.id)
+            _EXISTING_IDS, {"acc_id": account.id, "ids": candidate_ids}
         )
-        existing_ids = set(r[0] for r in existing_result.all())
+        existing_ids = {r[0] for r in existing_result.all()}
 
-        new_count = 0
+        rows = []
         for msg in messages:
             msg_id = msg.get("id")
             if not msg_id or msg_id in existing_ids:
@@ -93,8 +215,8 @@ async def _save_emails_from_list(session, account: Account, messages: list):
             raw_time = msg.get("receivedDateTime")
             if raw_time:
                 try:
-                    received_at = dtparser.isoparse(raw_time).replace(tzinfo=None)
-                except Exception:
+                    received_at = datetime.fromisoformat(raw_time.replace("Z", "+00:00")).replace(tzinfo=None)
+                except ValueError:
                     pass
 
             # Extract full HTML body
@@ -104,171 +226,221 @@ async def _save_emails_from_list(session, account: Account, messages: list):
                 body_html = body_data.get("content")
             # If no body dict, maybe a direct string (should not happen but safe guard)
 
-            email_record = Email(
-                account_id=account.id,
-                message_id=msg_id,
-                subject=(msg.get("subject") or "")[:500],
-                sender_name=(sender_name or "")[:255],
-                sender_address=(sender_address or "")[:255],
-                is_read=msg.get("isRead", False),
-                body_preview=(msg.get("bodyPreview") or "")[:500],
-                body_html=body_html,
-                received_at=received_at,
-            )
-            session.add(email_record)
-            new_count += 1
+            rows.append({
+                "account_id": account.id,
+                "message_id": msg_id,
+                "subject": (msg.get("subject") or "")[:500],
+                "sender_name": (sender_name or "")[:255],
+                "sender_address": (sender_address or "")[:255],
+                "is_read": msg.get("isRead", False),
+                "body_preview": (msg.get("bodyPreview") or "")[:500],
+                "body_html": body_html,
+                "received_at": received_at,
+                "created_at": datetime.utcnow(),
+            })
+
+        if not rows:
+            return 0
 
-        return new_count
+        # One multi-row INSERT; uq_account_message still guards against a concurrent save
+        result = await session.execute(
+            sqlite_insert(Email).values(rows)
+            .on_conflict_do_nothing(index_elements=["account_id", "message_id"])
+        )
+        return result.rowcount
     except Exception as e:
         logger.warning(f"保存邮件失败 {account.email}: {e}")
         return 0
 
 
+# Sync protocols in default fallback order, and their log labels
+_METHODS_ORDER = ("graph", "imap_new", "imap_old")
+_METHOD_LABELS = {"graph": "Graph", "imap_new": "IMAP(新)", "imap_old": "IMAP(旧)"}
+
+# Account columns _sync_one may change; every row in the bulk UPDATE sets all of them
+_SYNC_COLUMNS = (
+    "status", "last_error", "last_synced", "unread_count",
+    "sync_method", "graph_enabled", "imap_enabled",
+)
+
+# Set by _maybe_refresh_token on the detached Account; written with the sync columns
+_TOKEN_COLUMNS = ("access_token", "refresh_token", "token_expires_at")
+
+
+async def _sync_one(sem: asyncio.Semaphore, db_lock: asyncio.Lock, session,
+                    account: Account, proxy_url: str, position: str) -> dict:
+    """Sync one account: refresh token if needed, then fetch and save via the fallback chain.
+
+    Network calls run under ``sem``; the shared session is only touched under ``db_lock``.
+    ``account`` is detached from that session, so nothing here is autoflushed.
+    Returns the sync and token columns this run changed (plus "id") for one
+    bulk UPDATE by the caller.
+    """
+    before = {f: getattr(account, f) for f in _SYNC_COLUMNS + _TOKEN_COLUMNS}
+    changes = {f: before[f] for f in _SYNC_COLUMNS}
+    async with sem:
+        try:
+            # Only refresh token if expired/expiring
+            token_ok = await _maybe_refresh_token(account, proxy_url)
+            if not token_ok:
+                _add_log("error", account.email, "Token 过期且刷新失败，跳过同步")
+                changes["status"] = "error"
+                changes["last_error"] = "Token 过期且刷新失败"
+                return _changed_row(account, before, changes)
+
+            used_method = None
+            saved = 0
+            sync_errors = []
+
+            # Fallback chain: Graph → IMAP New → IMAP Old, last working method first
+            methods_order = _METHODS_ORDER
+            last_method = changes["sync_method"]
+            if last_method in _METHODS_ORDER:
+                methods_order = (last_method,) + tuple(m for m in _METHODS_ORDER if m != last_method)
+
+            for method in methods_order:
+                try:
+                    if method == "graph":
+                        # Messages and unread count in one $batch round trip
+                        data = await outlook_client.fetch_emails(
+                            account.access_token, top=30, proxy_url=proxy_url,
+                            include_unread_count=True,
+                        )
+                        unread = data["unread_count"]
+                        old_unread = changes["unread_count"] or 0
+                        if unread > old_unread:
+                            new_email_events[account.id] += unread - old_unread
+                            _add_log("info", account.email, f"{unread - old_unread} 封新邮件")
+                            logger.info(f"📬 {account.email}: {unread - old_unread} 封新邮件")
+                        changes["unread_count"] = unread
+                        changes["graph_enabled"] = True
+                        async with db_lock:
+                            saved = await _save_emails_from_list(session, account, data.get("value", []))
+                        used_method = "graph"
+
+                    elif method in ("imap_new", "imap_old"):
+                        data = await outlook_client.fetch_emails_imap(
+                            account.email, account.password,
+                            account.client_id, account.refresh_token,
+                            top=30, method=method,
+                        )
+                        imap_unread = data.get("_unread_count", 0)
+                        old_unread = changes["unread_count"] or 0
+                        if imap_unread > old_unread:
+                            new_email_events[account.id] += imap_unread - old_unread
+                            _add_log("info", account.email, f"{imap_unread - old_unread} 封新邮件")
+                            logger.info(f"📬 {account.email}: {imap_unread - old_unread} 封新邮件 (IMAP)")
+                        changes["unread_count"] = imap_unread
+                        changes["imap_enabled"] = True
+                        async with db_lock:
+                            saved = await _save_emails_from_list(session, account, data.get("value", []))
+                        used_method = method
+
+                    # Success — mark and break
+                    changes["sync_method"] = used_method
+                    break
+                except Exception as e:
+                    sync_errors.append(f"{method}: {str(e)[:100]}")
+                    logger.info(f"{method} 失败 {account.email}: {e}")
+
+            if not used_method:
+                changes["sync_method"] = None
+                changes["graph_enabled"] = None  # 重置，下次重新尝试 Graph
+                raise Exception("所有协议均失败: " + "; ".join(sync_errors))
+
+            changes["status"] = "active"
+            changes["last_synced"] = datetime.utcnow()
+            changes["last_error"] = None
+
+            if saved > 0:
+                _add_log("info", account.email, f"保存了 {saved} 封新邮件到本地")
+                logger.info(f"💾 {account.email}: 保存了 {saved} 封新邮件到本地")
+
+            _add_log("success", account.email,
+                     f"同步成功 via {_METHOD_LABELS.get(used_method, used_method)} ({position})，未读: {changes['unread_count']}")
+
+        except Exception as e:
+            err_msg = str(e)[:200]
+            logger.error(f"同步 {account.email} 失败: {e}")
+            changes["status"] = "error"
+            changes["last_error"] = str(e)[:500]
+            _add_log("error", account.email, f"同步失败: {err_msg}")
+    return _changed_row(account, before, changes)
+
+
+def _changed_row(account: Account, before: dict, changes: dict) -> dict:
+    """Only the columns that differ from ``before``, so the UPDATE doesn't
+    overwrite edits made to the others while the sync ran."""
+    for f in _TOKEN_COLUMNS:
+        changes[f] = getattr(account, f)
+    row = {f: v for f, v in changes.items() if v != before[f]}
+    row["id"] = account.id
+    return row
+
+
 async def _sync_accounts_for_group(group_id: int):
     """Background job: sync batch of accounts from a specific group (round-robin)."""
-    global _group_offsets
-
     async with async_session() as session:
-        # Load group config
-        grp_result = await session.execute(
-            select(Group).where(Group.id == group_id)
+        # Group config and its account count in one query. Plain columns, because
+        # a Group entity would selectin-load every account in the group.
+        in_group = (
+            Account.status != "disabled",
+            Account.group_id == group_id,
         )
-        grp = grp_result.scalar_one_or_none()
-        if not grp or not grp.auto_sync:
+        grp = (await session.execute(
+            select(
+                Group.name, Group.auto_sync, Group.sync_batch_size, Group.proxy_url,
+                func.count(Account.id).label("total"),
+            )
+            .outerjoin(Account, and_(*in_group))
+            .where(Group.id == group_id)
+            .group_by(Group.id)
+        )).one_or_none()
+        if not grp or not grp.auto_sync or grp.total == 0:
             return
 
         batch_size = grp.sync_batch_size or 1
         proxy_url = grp.proxy_url or None
+        total = grp.total
 
-        # Get accounts in this group
-        result = await session.execute(
-            select(Account)
-            .where(
-                Account.status != "disabled",
-                Account.group_id == group_id,
-            )
-            .order_by(Account.id)
-        )
-        all_accounts: List[Account] = list(result.scalars().all())
-        total = len(all_accounts)
-
-        if total == 0:
-            return
+        # Pick batch_size accounts (round-robin, capped at total so none repeat)
+        offset, count = await sync_state.claim(group_id, total, batch_size)
 
-        # Pick batch_size accounts (round-robin)
-        offset = _group_offsets.get(group_id, 0) % total
-        batch_indices = []
-        for i in range(batch_size):
-            idx = (offset + i) % total
-            batch_indices.append(idx)
-            if idx == total - 1 and i < batch_size - 1:
-                # Wrap around but still continue batch
-                pass
-
-        # De-duplicate indices (in case batch_size > total)
-        seen = set()
-        unique_indices = []
-        for idx in batch_indices:
-            if idx not in seen:
-                seen.add(idx)
-                unique_indices.append(idx)
-
-        for idx in unique_indices:
-            account = all_accounts[idx]
+        # The slice may wrap past the last account back to the first
+        ranges = [(offset, min(count, total - offset))]
+        if offset + count > total:
+            ranges.append((0, offset + count - total))
+        batch: List[Tuple[int, Account]] = []
+        for start, size in ranges:
+            result = await session.execute(
+                select(Account).options(noload(Account.group)).where(*in_group)
+                .order_by(Account.id).offset(start).limit(size)
+            )
+            batch.extend(enumerate(result.scalars().all(), start))
+        # The jobs share this session but run concurrently; detached accounts
+        # can't be autoflushed half-updated by another job's save
+        session.expunge_all()
+
+        sem = asyncio.Semaphore(SYNC_CONCURRENCY)
+        db_lock = asyncio.Lock()
+        jobs = []
+        for idx, account in batch:
             logger.info(
                 f"⏱ 分组[{grp.name}] 同步: 第 {idx + 1}/{total} 个账号 — {account.email}"
             )
-
-            try:
-                # Only refresh token if expired/expiring
-                token_ok = await _maybe_refresh_token(account, proxy_url)
-                if not token_ok:
-                    _add_log("error", account.email, "Token 过期且刷新失败，跳过同步")
-                    account.status = "error"
-                    account.last_error = "Token 过期且刷新失败"
-                    await session.commit()
-                    continue
-
-                used_method = None
-                saved = 0
-                sync_errors = []
-
-                # Fallback chain: Graph → IMAP New → IMAP Old
-                methods_order = ["graph", "imap_new", "imap_old"]
-                if account.sync_method and account.sync_method in methods_order:
-                    methods_order.remove(account.sync_method)
-                    methods_order.insert(0, account.sync_method)
-
-                for method in methods_order:
-                    try:
-                        if method == "graph":
-                            data = await outlook_client.fetch_emails(
-                                account.access_token, top=30, proxy_url=proxy_url
-                            )
-                            unread = await outlook_client.get_unread_count(account.access_token, proxy_url=proxy_url)
-                            old_unread = account.unread_count or 0
-                            if unread > old_unread:
-                                new_email_events[account.id] = unread - old_unread
-                                _add_log("info", account.email, f"{unread - old_unread} 封新邮件")
-                                logger.info(f"📬 {account.email}: {unread - old_unread} 封新邮件")
-                            account.unread_count = unread
-                            account.graph_enabled = True
-                            saved = await _save_emails_from_list(session, account, data.get("value", []))
-                            used_method = "graph"
-
-                        elif method in ("imap_new", "imap_old"):
-                            data = await outlook_client.fetch_emails_imap(
-                                account.email, account.password,
-                                account.client_id, account.refresh_token,
-                                top=30, method=method,
-                            )
-                            imap_unread = data.get("_unread_count", 0)
-                            old_unread = account.unread_count or 0
-                            if imap_unread > old_unread:
-                                new_email_events[account.id] = imap_unread - old_unread
-                                _add_log("info", account.email, f"{imap_unread - old_unread} 封新邮件")
-                                logger.info(f"📬 {account.email}: {imap_unread - old_unread} 封新邮件 (IMAP)")
-                            account.unread_count = imap_unread
-                            account.imap_enabled = True
-                            saved = await _save_emails_from_list(session, account, data.get("value", []))
-                            used_method = method
-
-                        # Success — mark and break
-                        account.sync_method = used_method
-                        break
-                    except Exception as e:
-                        sync_errors.append(f"{method}: {str(e)[:100]}")
-                        logger.info(f"{method} 失败 {account.email}: {e}")
-
-                if not used_method:
-                    account.sync_method = None
-                    account.graph_enabled = None  # 重置，下次重新尝试 Graph
-                    raise Exception("所有协议均失败: " + "; ".join(sync_errors))
-
-                account.status = "active"
-                account.last_synced = datetime.utcnow()
-                account.last_error = None
-
-                if saved > 0:
-                    _add_log("info", account.email, f"保存了 {saved} 封新邮件到本地")
-                    logger.info(f"💾 {account.email}: 保存了 {saved} 封新邮件到本地")
-
-                method_labels = {"graph": "Graph", "imap_new": "IMAP(新)", "imap_old": "IMAP(旧)"}
-                _add_log("success", account.email,
-                         f"同步成功 via {method_labels.get(used_method, used_method)} ({idx + 1}/{total})，未读: {account.unread_count}")
-
-            except Exception as e:
-                err_msg = str(e)[:200]
-                logger.error(f"同步 {account.email} 失败: {e}")
-                account.status = "error"
-                account.last_error = str(e)[:500]
-                _add_log("error", account.email, f"同步失败: {err_msg}")
-
+            jobs.append(_sync_one(sem, db_lock, session, account, proxy_url, f"{idx + 1}/{total}"))
+        rows = [row for row in await asyncio.gather(*jobs) if len(row) > 1]
+
+        # One executemany UPDATE for the whole batch, token columns included.
+        # Rows set different columns; sorting keeps rows with the same set together
+        # so each set goes out as one executemany.
+        if rows:
+            rows.sort(key=lambda row: sorted(row))
+            await session.execute(update(Account), rows)
+        # Also commits the emails the jobs saved
         await session.commit()
-
-        # Advance offset
-        next_offset = (offset + len(unique_indices)) % total
-        _group_offsets[group_id] = next_offset
+        accounts = {account.id: account for _, account in batch}
+        publish_tokens(accounts[row["id"]] for row in rows if "access_token" in row)
 
     logger.info(f"分组[{group_id}] 本次同步完成")
 
@@ -283,12 +455,21 @@ async def _refresh_group_tokens(group_id: int):
         if not grp:
             return
 
-        proxy_url = grp.proxy_url or None
-
+        # Skip accounts refreshed successfully (by any path) within the last half
+        # interval; the next run picks them up. Access-token expiry can't drive
+        # this, as it is only about an hour away right after any refresh. Half,
+        # not a full interval, so the previous run's own refreshes aren't skipped.
+        fresh_since = datetime.utcnow() - timedelta(hours=(grp.refresh_interval_hours or 24) / 2)
         result = await session.execute(
-            select(Account).where(
+            select(Account).options(WITH_GROUP).where(
                 Account.group_id == group_id,
                 Account.refresh_token.isnot(None),
+                or_(
+                    Account.refresh_status != "success",
+                    Account.refresh_status.is_(None),
+                    Account.last_refresh_at.is_(None),
+                    Account.last_refresh_at < fresh_since,
+                ),
             )
         )
         accounts = list(result.scalars().all())
@@ -299,32 +480,32 @@ async def _refresh_group_tokens(group_id: int):
         logger.info(f"⏰ 分组[{grp.name}] 定时刷新 Token 开始 ({len(accounts)} 个账号)")
         _add_log("info", "-", f"分组[{grp.name}] 定时刷新 Token 开始")
 
-        from routes.refresh import _do_refresh_one
-        success_count = 0
-        fail_count = 0
-
-        for account in accounts:
-            ok, err = await _do_refresh_one(account, session, refresh_type="auto")
-            if ok:
-                success_count += 1
-            else:
-                fail_count += 1
+        success_count, fail_count = await refresh_many(accounts, session, "auto")
 
         _add_log("info", "-",
                  f"分组[{grp.name}] Token 刷新完成: 成功 {success_count}, 失败 {fail_count}")
         logger.info(f"⏰ 分组[{grp.name}] Token 刷新完成: 成功 {success_count}, 失败 {fail_count}")
 
 
+def _invalidate_status_cache(event=None):
+    global _status_cache
+    _status_cache = None
+
+
 def get_sync_status():
     """Return current sync scheduler status for the API."""
+    global _status_cache
+    now = time.monotonic()
+    if _status_cache and _status_cache[0] > now:
+        return _status_cache[1]
     jobs = scheduler.get_jobs()
     sync_jobs = [j for j in jobs if j.id.startswith("sync_group_")]
     refresh_jobs = [j for j in jobs if j.id.startswith("refresh_group_")]
-    return {
+    status = {
         "running": len(sync_jobs) > 0,
         "sync_groups": len(sync_jobs),
         "refresh_groups": len(refresh_jobs),
-        "group_offsets": dict(_group_offsets),
+        "group_offsets": dict(sync_state.group_offsets),
         "jobs": [
             {
                 "id": j.id,
@@ -333,11 +514,50 @@ def get_sync_status():
             for j in jobs
         ],
     }
+    _status_cache = (now + STATUS_CACHE_TTL, status)
+    return status
+
+
+async def subscribe_sync_log(idle_seconds: float) -> AsyncIterator[Optional[dict]]:
+    """Yield sync log entries as they are added, or None after idle_seconds of silence.
+    Ends when the subscriber falls SYNC_LOG_SUBSCRIBER_BUFFER entries behind.
+    """
+    q: asyncio.Queue = asyncio.Queue(maxsize=SYNC_LOG_SUBSCRIBER_BUFFER)
+    _log_subscribers.add(q)
+    try:
+        while True:
+            try:
+                entry = await asyncio.wait_for(q.get(), idle_seconds)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if entry is _LOG_CLOSED:
+                return
+            yield entry
+    finally:
+        _log_subscribers.discard(q)
+
 
+async def get_sync_log():
+    """Return recent sync log entries (from Redis when configured)."""
+    global _log_cache
+    now = time.monotonic()
+    if _log_cache and _log_cache[0] > now:
+        return _log_cache[1]
+    entries = None
+    if _redis is not None:
+        try:
+            entries = [orjson.loads(e) for e in await _redis.lrange(SYNC_LOG_KEY, 0, -1)]
+        except Exception as e:
+            logger.debug(f"读取 Redis 同步日志失败: {e}")
+    if entries is None:
+        entries = [_log_entry(r) for r in sync_log]
+    _log_cache = (now + SYNC_LOG_CACHE_TTL, entries)
+    return entries
 
-def get_sync_log():
-    """Return recent sync log entries."""
-    return list(sync_log)
+
+# Accounts loaded per chunk by the scheduled refresh-all job
+REFRESH_SCAN_CHUNK = 200
 
 
 async def auto_refresh_all_tokens():
@@ -345,22 +565,28 @@ async def auto_refresh_all_tokens():
     logger.info("⏰ 定时刷新 Token 开始")
     _add_log("info", "-", "定时刷新 Token 开始")
 
-    from routes.refresh import _do_refresh_one
-
     async with async_session() as session:
-        result = await session.execute(
-            select(Account).where(Account.refresh_token.isnot(None))
-        )
-        accounts = list(result.scalars().all())
+        # Walk accounts in id-ordered chunks so only one chunk of rows (tokens
+        # included) is held at a time; refresh_many commits, so no cursor stays open
         success_count = 0
         fail_count = 0
-
-        for account in accounts:
-            ok, err = await _do_refresh_one(account, session, refresh_type="auto")
-            if ok:
-                success_count += 1
-            else:
-                fail_count += 1
+        last_id = 0
+        while True:
+            result = await session.execute(
+                select(Account)
+                .options(WITH_GROUP)
+                .where(Account.refresh_token.isnot(None), Account.id > last_id)
+                .order_by(Account.id)
+                .limit(REFRESH_SCAN_CHUNK)
+            )
+            chunk = result.scalars().all()
+            if not chunk:
+                break
+            ok, failed = await refresh_many(chunk, session, "auto")
+            success_count += ok
+            fail_count += failed
+            last_id = chunk[-1].id
+            session.expunge_all()
 
         _add_log("info", "-",
                  f"定时刷新完成: 成功 {success_count}, 失败 {fail_count}")
@@ -533,16 +759,45 @@ async def reload_group_job(group_id: int):
         _add_log("info", "-", f"分组[{grp.name}] Token 刷新已更新: 每 {refresh_hours} 小时")
 
 
-def start_scheduler():
+async def purge_old_refresh_logs():
+    """Scheduled job: delete refresh logs past the retention window."""
+    cutoff = datetime.utcnow() - timedelta(days=REFRESH_LOG_RETENTION_DAYS)
+    async with async_session() as session:
+        result = await session.execute(
+            delete(RefreshLog).where(RefreshLog.created_at < cutoff)
+        )
+        await session.commit()
+    if result.rowcount:
+        logger.info(f"🧹 已清理 {result.rowcount} 条过期刷新日志")
+
+
+async def start_scheduler():
+    """Start the scheduler and register every job before returning.
+
+    Runs inside the app lifespan, so setup errors surface at startup instead of
+    vanishing in fire-and-forget tasks.
+    """
+    _init_redis()
+    scheduler.add_listener(
+        _invalidate_status_cache, EVENT_JOB_ADDED | EVENT_JOB_REMOVED | EVENT_JOB_MODIFIED
+    )
     scheduler.start()
     _add_log("info", "-", "调度器启动")
     logger.info("调度器已启动")
 
+    # Daily refresh-log purge, first run at startup
+    scheduler.add_job(
+        purge_old_refresh_logs,
+        "interval",
+        hours=24,
+        id="purge_refresh_logs",
+        replace_existing=True,
+        next_run_time=datetime.now(),
+    )
+
     # Set up per-group jobs and timed refresh
-    import asyncio
-    loop = asyncio.get_event_loop()
-    loop.create_task(_setup_group_jobs())
-    loop.create_task(init_refresh_schedule())
+    await _setup_group_jobs()
+    await init_refresh_schedule()
 
 
 def stop_scheduler():
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import Optional, List
 from datetime import datetime
 
@@ -43,8 +43,7 @@ class GroupResponse(BaseModel):
     account_count: int = 0
     created_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # ── Account ──────────────────────────────────────────────
@@ -78,8 +77,7 @@ class AccountResponse(BaseModel):
     last_error: Optional[str] = None
     created_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class AccountUpdate(BaseModel):
@@ -137,6 +135,7 @@ class EmailListResponse(BaseModel):
     emails: List[EmailSummary]
     total: int
     method: Optional[str] = None  # "Graph API" / "IMAP (New)" / "IMAP (Old)" / "Local DB"
+    next_cursor: Optional[str] = None  # Local DB only: pass back as ?cursor= for the next page
 
 
 class SyncStatus(BaseModel):
@@ -159,13 +158,13 @@ class LocalEmailSummary(BaseModel):
     is_read: bool = False
     body_preview: Optional[str] = None
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class SearchEmailResponse(BaseModel):
     results: List[LocalEmailSummary]
     total: int
+    next_cursor: Optional[str] = None  # pass back as ?cursor= for the next page
 
 
 # ── Settings ────────────────────────────────────────────
@@ -195,8 +194,7 @@ class RefreshLogResponse(BaseModel):
     error_message: Optional[str] = None
     created_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class RefreshStatsResponse(BaseModel):
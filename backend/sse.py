@@ -0,0 +1,27 @@
+"""Server-Sent Events helpers shared by the streaming routes."""
+from typing import AsyncIterator
+
+import orjson
+from fastapi.responses import StreamingResponse
+
+# Seconds of silence before a stream sends a keep-alive comment
+SSE_PING_SECONDS = 15
+
+# Comment frame that keeps proxies from closing an idle stream
+SSE_PING = b": ping\n\n"
+
+
+def sse_event(event: dict) -> bytes:
+    return b"data: " + orjson.dumps(event) + b"\n\n"
+
+
+def sse_response(frames: AsyncIterator[bytes]) -> StreamingResponse:
+    return StreamingResponse(
+        frames,
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+    )
@@ -0,0 +1,31 @@
+import os
+import sys
+from contextlib import asynccontextmanager
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from database import Base  # noqa: E402
+import models  # noqa: E402,F401  (registers the tables on Base)
+
+
+@asynccontextmanager
+async def _memory_db():
+    """A fresh in-memory database; yields a sessionmaker bound to it."""
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        yield async_sessionmaker(engine, expire_on_commit=False)
+    finally:
+        await engine.dispose()
+
+
+@pytest.fixture
+def memory_db():
+    """``async with memory_db() as sessionmaker:`` inside the test's own event loop."""
+    return _memory_db
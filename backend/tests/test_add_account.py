@@ -0,0 +1,40 @@
+"""add_account: only the accounts.email UNIQUE is reported as a duplicate."""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from routes import accounts as accounts_routes
+from schemas import AccountCreate
+
+
+async def _add_twice(memory_db):
+    async with memory_db() as sessionmaker:
+        payload = AccountCreate(email="dup@example.com", password="x")
+        async with sessionmaker() as session:
+            await accounts_routes.add_account(payload, session=session)
+        async with sessionmaker() as session:
+            await accounts_routes.add_account(payload, session=session)
+
+
+async def _add_with_bad_group(memory_db):
+    async with memory_db() as sessionmaker:
+        async with sessionmaker() as session:
+            await session.execute(text("PRAGMA foreign_keys=ON"))
+            await accounts_routes.add_account(
+                AccountCreate(email="a@example.com", password="x", group_id=999),
+                session=session,
+            )
+
+
+def test_duplicate_email_is_a_400(memory_db):
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(_add_twice(memory_db))
+    assert exc.value.status_code == 400
+
+
+def test_other_integrity_errors_are_not_reported_as_duplicates(memory_db):
+    with pytest.raises(IntegrityError):
+        asyncio.run(_add_with_bad_group(memory_db))
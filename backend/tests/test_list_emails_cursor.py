@@ -0,0 +1,69 @@
+"""list_emails: a cursor pages through the local DB and never hits Graph or IMAP."""
+import asyncio
+from datetime import datetime, timedelta
+
+import orjson
+from fastapi import BackgroundTasks
+
+from models import Account, Email
+from outlook_client import outlook_client
+from routes import emails as emails_routes
+
+EMAIL_COUNT = 7
+PAGE_SIZE = 3
+
+
+async def _walk_pages(memory_db, monkeypatch):
+    remote_calls = []
+
+    async def _remote_down(*args, **kwargs):
+        remote_calls.append(kwargs.get("skip", 0))
+        raise RuntimeError("offline")
+
+    monkeypatch.setattr(outlook_client, "fetch_emails", _remote_down)
+    monkeypatch.setattr(outlook_client, "fetch_emails_imap", _remote_down)
+
+    async with memory_db() as sessionmaker:
+        async with sessionmaker() as session:
+            account = Account(
+                email="a@example.com", password="x", client_id="cid",
+                refresh_token="rt", access_token="at",
+                token_expires_at=datetime.utcnow() + timedelta(hours=1),
+            )
+            session.add(account)
+            await session.flush()
+            base = datetime(2024, 1, 1)
+            session.add_all(
+                Email(account_id=account.id, message_id=f"m{i}", subject=f"s{i}",
+                      received_at=base + timedelta(hours=i))
+                for i in range(EMAIL_COUNT)
+            )
+            await session.commit()
+            account_id = account.id
+        emails_routes.invalidate_account_cache(account_id)
+
+        pages = []
+        cursor = None
+        async with sessionmaker() as session:
+            while True:
+                resp = await emails_routes.list_emails(
+                    account_id, BackgroundTasks(), top=PAGE_SIZE, skip=0,
+                    folder="inbox", cursor=cursor, session=session,
+                )
+                page = orjson.loads(resp.body)
+                pages.append(page)
+                cursor = page["next_cursor"]
+                if not cursor:
+                    break
+                assert len(pages) <= EMAIL_COUNT, "cursor never ran out"
+        emails_routes.invalidate_account_cache(account_id)
+    return pages, remote_calls
+
+
+def test_cursor_pages_stay_on_local_db(memory_db, monkeypatch):
+    pages, remote_calls = asyncio.run(_walk_pages(memory_db, monkeypatch))
+    ids = [e["id"] for page in pages for e in page["emails"]]
+    assert ids == [f"m{i}" for i in reversed(range(EMAIL_COUNT))]
+    assert all(page["method"] == "Local DB" for page in pages)
+    # Only the first, cursor-less request tried Graph and IMAP
+    assert len(remote_calls) == 2
@@ -0,0 +1,71 @@
+"""refresh-all: a client disconnecting mid-stream must not lose rotated tokens."""
+import asyncio
+
+import anyio
+import orjson
+from sqlalchemy import select
+
+from models import Account
+from routes import refresh as refresh_routes
+
+FAST_ACCOUNTS = 3
+SLOW_ACCOUNTS = 22
+
+
+async def _fake_fetch_token(account, proxy_url=None):
+    # The first accounts answer at once, the rest are still in flight when
+    # the client goes away
+    if account.id > FAST_ACCOUNTS:
+        await asyncio.sleep(0.05)
+    return {
+        "access_token": f"access-{account.id}",
+        "refresh_token": f"rotated-{account.id}",
+        "expires_in": 3600,
+    }, None
+
+
+async def _disconnect_mid_stream(memory_db, monkeypatch):
+    async with memory_db() as sessionmaker:
+        monkeypatch.setattr(refresh_routes, "async_session", sessionmaker)
+        monkeypatch.setattr(refresh_routes, "fetch_token", _fake_fetch_token)
+        async with sessionmaker() as session:
+            session.add_all(
+                Account(email=f"u{i}@example.com", password="x",
+                        client_id="cid", refresh_token=f"old-{i}")
+                for i in range(1, FAST_ACCOUNTS + SLOW_ACCOUNTS + 1)
+            )
+            await session.commit()
+
+        response = await refresh_routes.refresh_all()
+        frames = []
+        # Starlette cancels the streaming task from an anyio scope on disconnect
+        with anyio.CancelScope() as scope:
+            async for frame in response.body_iterator:
+                frames.append(frame)
+                if b'"progress"' in frame:
+                    scope.cancel()
+
+        async with sessionmaker() as session:
+            tokens = dict((await session.execute(
+                select(Account.id, Account.refresh_token)
+            )).all())
+    return frames, tokens
+
+
+def test_disconnect_keeps_rotated_tokens(memory_db, monkeypatch):
+    frames, tokens = asyncio.run(_disconnect_mid_stream(memory_db, monkeypatch))
+    assert not any(b'"done"' in f for f in frames)
+    reported = [orjson.loads(f[len(b"data: "):]) for f in frames if b'"progress"' in f]
+    assert reported
+    # Every refresh the client was told about is persisted, though it came
+    # before the first REFRESH_COMMIT_BATCH commit
+    for event in reported:
+        account_id = int(event["email"][1:].split("@")[0])
+        assert tokens[account_id] == f"rotated-{account_id}"
+
+    # Refreshes already sent to Microsoft are finished and kept; only the
+    # ones still queued behind REFRESH_CONCURRENCY are dropped
+    in_flight = FAST_ACCOUNTS + refresh_routes.REFRESH_CONCURRENCY
+    for account_id, token in tokens.items():
+        expected = f"rotated-{account_id}" if account_id <= in_flight else f"old-{account_id}"
+        assert token == expected
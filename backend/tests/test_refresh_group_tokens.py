@@ -0,0 +1,52 @@
+"""_refresh_group_tokens: recently refreshed accounts are skipped."""
+import asyncio
+from datetime import datetime, timedelta
+
+import scheduler
+from models import Account, Group
+
+REFRESH_INTERVAL_HOURS = 24
+
+
+async def _scheduled_refresh(memory_db, monkeypatch):
+    refreshed = []
+
+    async def _fake_refresh_many(accounts, session, refresh_type):
+        refreshed.extend(a.email for a in accounts)
+        return len(accounts), 0
+
+    monkeypatch.setattr(scheduler, "refresh_many", _fake_refresh_many)
+
+    async with memory_db() as sessionmaker:
+        monkeypatch.setattr(scheduler, "async_session", sessionmaker)
+        now = datetime.utcnow()
+        async with sessionmaker() as session:
+            group = Group(name="g", refresh_interval_hours=REFRESH_INTERVAL_HOURS)
+            session.add(group)
+            await session.flush()
+
+            def account(email, **kw):
+                return Account(email=email, password="x", client_id="cid",
+                               refresh_token="rt", group_id=group.id,
+                               # A fresh access token expires within the hour either way
+                               token_expires_at=now + timedelta(minutes=50), **kw)
+
+            session.add_all([
+                account("recent@example.com", refresh_status="success",
+                        last_refresh_at=now - timedelta(hours=1)),
+                account("stale@example.com", refresh_status="success",
+                        last_refresh_at=now - timedelta(hours=REFRESH_INTERVAL_HOURS)),
+                account("failed@example.com", refresh_status="failed",
+                        last_refresh_at=now - timedelta(hours=1)),
+                account("never@example.com"),
+            ])
+            await session.commit()
+            group_id = group.id
+
+        await scheduler._refresh_group_tokens(group_id)
+    return refreshed
+
+
+def test_recently_refreshed_accounts_are_skipped(memory_db, monkeypatch):
+    refreshed = asyncio.run(_scheduled_refresh(memory_db, monkeypatch))
+    assert sorted(refreshed) == ["failed@example.com", "never@example.com", "stale@example.com"]
@@ -0,0 +1,81 @@
+"""search_emails: following next_cursor must visit the same rows, in the same
+order, as walking the offset pages."""
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from database import Base
+from models import Account, Email
+from routes import emails as emails_routes
+
+EMAIL_COUNT = 15
+PAGE_SIZE = 4
+
+
+async def _seed(session):
+    account = Account(email="a@example.com", password="x")
+    session.add(account)
+    await session.flush()
+    base = datetime(2024, 1, 1)
+    for i in range(EMAIL_COUNT):
+        session.add(Email(
+            account_id=account.id,
+            message_id=f"m{i}",
+            subject=f"hello {i}",
+            # Mixed read state exercises the is_read part of the cursor
+            is_read=i % 3 == 0,
+            # Shared and missing dates exercise the id and NULL tie-breaks
+            received_at=None if i % 5 == 4 else base + timedelta(hours=i // 2),
+        ))
+    await session.commit()
+
+
+async def _search(session, page=1, cursor=None):
+    return await emails_routes.search_emails(
+        keyword="hello", account_email="", group_id=None,
+        page=page, page_size=PAGE_SIZE, cursor=cursor, session=session,
+    )
+
+
+async def _walk_both():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    emails_routes._search_total_cache.clear()
+    try:
+        async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+            await _seed(session)
+
+            offset_ids = []
+            page = 1
+            while True:
+                resp = await _search(session, page=page)
+                if not resp.results:
+                    break
+                offset_ids += [r.id for r in resp.results]
+                page += 1
+
+            cursor_ids = []
+            cursor = None
+            while True:
+                resp = await _search(session, cursor=cursor)
+                cursor_ids += [r.id for r in resp.results]
+                assert resp.total == EMAIL_COUNT
+                cursor = resp.next_cursor
+                if not cursor:
+                    break
+    finally:
+        await engine.dispose()
+    return offset_ids, cursor_ids
+
+
+def test_cursor_pages_match_offset_pages():
+    offset_ids, cursor_ids = asyncio.run(_walk_both())
+    assert len(offset_ids) == EMAIL_COUNT
+    assert cursor_ids == offset_ids
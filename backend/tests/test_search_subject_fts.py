@@ -0,0 +1,111 @@
+"""Subject search: the FTS5 trigram path, its LIKE fallback, and the triggers
+that keep emails_fts in step with emails."""
+import asyncio
+
+import pytest
+from sqlalchemy import delete, text, update
+
+import database
+from models import Account, Email
+from routes import emails as emails_routes
+
+
+async def _search(session, keyword):
+    emails_routes._search_total_cache.clear()
+    resp = await emails_routes.search_emails(
+        keyword=keyword, account_email="", group_id=None,
+        page=1, page_size=50, cursor=None, session=session,
+    )
+    return sorted(r.subject for r in resp.results)
+
+
+async def _fts_rowids(session, keyword):
+    phrase = '"' + keyword + '"'
+    rows = await session.execute(
+        text("SELECT rowid FROM emails_fts WHERE emails_fts MATCH :p"), {"p": phrase}
+    )
+    return sorted(r[0] for r in rows)
+
+
+async def _with_fts(memory_db, body):
+    async with memory_db() as sessionmaker:
+        async with sessionmaker() as session:
+            account = Account(email="a@example.com", password="x")
+            session.add(account)
+            await session.flush()
+            # Saved before the index exists: picked up by the initial rebuild
+            session.add(Email(account_id=account.id, message_id="old", subject="Invoice 2024"))
+            await session.commit()
+            account_id = account.id
+
+        async with sessionmaker() as session:
+            conn = await session.connection()
+            await conn.run_sync(database._setup_subject_fts)
+            await session.commit()
+        if not database.has_subject_fts():
+            return None
+
+        async with sessionmaker() as session:
+            return await body(session, account_id)
+
+
+def _run(memory_db, monkeypatch, body):
+    # _setup_subject_fts flips the module flag; put it back afterwards
+    monkeypatch.setattr(database, "_subject_fts", False)
+    result = asyncio.run(_with_fts(memory_db, body))
+    if result is None:
+        pytest.skip("SQLite build without FTS5 trigram support")
+    return result
+
+
+def test_trigram_and_like_paths(memory_db, monkeypatch):
+    async def body(session, account_id):
+        session.add_all([
+            Email(account_id=account_id, message_id="m1", subject="月度报告 总结"),
+            Email(account_id=account_id, message_id="m2", subject="hi there"),
+            Email(account_id=account_id, message_id="m3", subject="Say Hi"),
+        ])
+        await session.commit()
+        return {
+            # 3+ characters: trigram MATCH, case-insensitive, CJK included
+            "voice": await _search(session, "voice"),
+            "INVOICE": await _search(session, "INVOICE"),
+            "月度报": await _search(session, "月度报"),
+            # Under 3 characters: LIKE fallback
+            "hi": await _search(session, "hi"),
+            "总结": await _search(session, "总结"),
+        }
+
+    found = _run(memory_db, monkeypatch, body)
+    assert found["voice"] == ["Invoice 2024"]
+    assert found["INVOICE"] == ["Invoice 2024"]
+    assert found["月度报"] == ["月度报告 总结"]
+    assert found["hi"] == ["Say Hi", "hi there"]
+    assert found["总结"] == ["月度报告 总结"]
+
+
+def test_index_follows_insert_update_delete(memory_db, monkeypatch):
+    async def body(session, account_id):
+        session.add(Email(account_id=account_id, message_id="new", subject="Shipping notice"))
+        await session.commit()
+        after_insert = (await _search(session, "shipping"), await _fts_rowids(session, "shipping"))
+
+        await session.execute(
+            update(Email).where(Email.message_id == "new").values(subject="Delivery notice")
+        )
+        await session.commit()
+        after_update = (
+            await _search(session, "shipping"),
+            await _search(session, "delivery"),
+            await _fts_rowids(session, "shipping"),
+        )
+
+        await session.execute(delete(Email).where(Email.message_id == "new"))
+        await session.commit()
+        after_delete = (await _search(session, "delivery"), await _fts_rowids(session, "delivery"))
+        return after_insert, after_update, after_delete
+
+    after_insert, after_update, after_delete = _run(memory_db, monkeypatch, body)
+    assert after_insert[0] == ["Shipping notice"] and len(after_insert[1]) == 1
+    assert after_update == ([], ["Delivery notice"], [])
+    assert after_delete == ([], [])
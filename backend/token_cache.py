@@ -0,0 +1,52 @@
+"""In-process cache of freshly refreshed OAuth tokens, keyed by account id.
+
+Code paths that refresh a token (email routes, scheduler, manual refresh,
+OAuth authorization) publish the result here once it is committed, so the
+email routes can pick it up without a DB read or write.
+"""
+import asyncio
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from config import TOKEN_REFRESH_SKEW_SECONDS
+
+# {account_id: (monotonic_expires_at, access_token, refresh_token, token_expires_at)}
+_tokens: Dict[int, Tuple[float, str, Optional[str], datetime]] = {}
+
+# Per-account locks so the web routes and the scheduler never refresh the same token at once
+_locks: Dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+
+def refresh_lock(account_id: int) -> asyncio.Lock:
+    return _locks[account_id]
+
+
+def put(account_id: int, access_token: str, refresh_token: Optional[str], expires_at: datetime):
+    """Remember a token until TOKEN_REFRESH_SKEW_SECONDS before it expires."""
+    ttl = (expires_at - datetime.utcnow()).total_seconds() - TOKEN_REFRESH_SKEW_SECONDS
+    if ttl <= 0:
+        return
+    _tokens[account_id] = (time.monotonic() + ttl, access_token, refresh_token, expires_at)
+
+
+def put_account(account) -> None:
+    """Publish the token currently set on an Account row."""
+    if account.id and account.access_token and account.token_expires_at:
+        put(account.id, account.access_token, account.refresh_token, account.token_expires_at)
+
+
+def get(account_id: int) -> Optional[Tuple[str, Optional[str], datetime]]:
+    """Return (access_token, refresh_token, token_expires_at) if still usable."""
+    entry = _tokens.get(account_id)
+    if not entry:
+        return None
+    if entry[0] <= time.monotonic():
+        _tokens.pop(account_id, None)
+        return None
+    return entry[1:]
+
+
+def drop(account_id: int):
+    _tokens.pop(account_id, None)